@@ -0,0 +1,44 @@
+import argparse
+import timeit
+from datetime import datetime
+
+from dateutil import tz
+
+from src.utils import util
+
+SECRET = 'SEC' + '0123456789abcdef' * 4
+TIME_STR = '2022-10-21 18:30:05'
+
+
+def legacy_parse_time(time_str):
+    try:
+        return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").replace(
+            tzinfo=tz.gettz('Asia/Shanghai'))
+    except ValueError:
+        return None
+
+
+def run(number):
+    signer = util.Signer(SECRET)
+    assert signer.sign('1666348205000') == util.get_sign(SECRET, '1666348205000')
+    # fromisoformat 能解析但 strptime 不接受的格式也要返回 None
+    for time_str in (TIME_STR, '2022-10-21', '2022-10-21T18:30:05Z', '2022-10-21 18:30:05+08:00'):
+        assert util.parse_time(time_str) == legacy_parse_time(time_str), time_str
+
+    cases = [
+        ('sign / message', lambda: util.get_sign(SECRET, '1666348205000'), lambda: signer.sign('1666348205000')),
+        ('parse_time / row', lambda: legacy_parse_time(TIME_STR), lambda: util.parse_time(TIME_STR)),
+        ('zone lookup', lambda: datetime.now(tz.gettz('Asia/Shanghai')), lambda: datetime.now(util.TZ)),
+    ]
+    print(f'{"case":<20}{"before (us)":>14}{"after (us)":>14}{"speedup":>10}')
+    for name, before, after in cases:
+        before_time = min(timeit.repeat(before, number=number, repeat=5)) / number * 1e6
+        after_time = min(timeit.repeat(after, number=number, repeat=5)) / number * 1e6
+        print(f'{name:<20}{before_time:>14.2f}{after_time:>14.2f}{before_time / after_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.number)
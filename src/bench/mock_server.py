@@ -0,0 +1,92 @@
+import json
+import multiprocessing
+import re
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.bench import synthetic
+
+QUESTION_PATTERN = re.compile(r'^/q/(\d+)$')
+
+
+# 本地替身：/robot/send 模拟钉钉机器人，/questionnaire 模拟金数据提问列表，/q/<i> 为单个问题
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体一次写出，避免 keep-alive 下的延迟确认拖慢每个请求
+    wbufsize = 1 << 16
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.send_latency)
+        self._reply(json.dumps({'errcode': 0, 'errmsg': 'ok'}), 'application/json')
+
+    def do_GET(self):
+        if self.path.startswith('/questionnaire'):
+            if self.headers.get('If-None-Match') == self.server.etag and self.server.honor_etag:
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self._reply(self.server.page, 'text/html; charset=utf-8', {'ETag': self.server.etag})
+            return
+        match = QUESTION_PATTERN.match(self.path)
+        if match is None:
+            self.send_error(404)
+            return
+        time.sleep(self.server.link_latency)
+        self._reply(synthetic.question_body(int(match.group(1))), 'text/plain; charset=utf-8')
+
+    def _reply(self, text, content_type, headers=None):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port_queue, rows, link_latency, send_latency, honor_etag):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    server.page = synthetic.questionnaire_page(rows, base_url, datetime(2022, 9, 1, 8, 0, 0))
+    server.etag = f'"{rows}"'
+    server.link_latency = link_latency
+    server.send_latency = send_latency
+    server.honor_etag = honor_etag
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+# 在独立进程中运行，避免与被测代码争用 GIL 和内存统计
+class MockServer:
+    def __init__(self, rows=100, link_latency=0.0, send_latency=0.0, honor_etag=False):
+        self.args = (rows, link_latency, send_latency, honor_etag)
+        self.process = None
+        self.port = None
+
+    def __enter__(self):
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(port_queue,) + self.args, daemon=True)
+        self.process.start()
+        self.port = port_queue.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def watermark(self, new_rows):
+        rows = self.args[0]
+        return (datetime(2022, 9, 1, 8, 0, 0) + timedelta(minutes=7) * (rows - new_rows)).strftime(
+            '%Y-%m-%d %H:%M:%S')
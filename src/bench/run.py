@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from src.bench import synthetic
+from src.bench.mock_server import MockServer
+from src.utils import sender, timetable2csv
+from src.utils.bot import CourseReMinderBot, QuestionBot
+from src.utils.conflicts import find_conflicts
+from src.utils.semester import SemesterCalendar
+from src.utils.timetable import get_store
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(name, count, elapsed, latencies):
+    print(f'{name:<40}{count:>8}{count / elapsed:>12.1f}{percentile(latencies, 50) * 1000:>10.2f}'
+          f'{percentile(latencies, 99) * 1000:>10.2f}{peak_rss_mb():>10.1f}')
+
+
+def write_config(workdir, name, config):
+    path = os.path.join(workdir, name)
+    with open(path, 'w', encoding='UTF-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    return path
+
+
+def base_config(workdir, server, token):
+    # 以测试模式创建机器人，日志不写入 log/record.log
+    return {
+        'test_access_token': token,
+        'test_secret': 'SEC' + token,
+        'webhook_url': server.base_url + '/robot/send',
+        'rate_limit': 1000000,
+        'state_path': os.path.join(workdir, 'state.db'),
+    }
+
+
+def bench_send(workdir, server, messages):
+    config = dict(base_config(workdir, server, 'send'), questionnaire_url=server.base_url + '/questionnaire',
+                  question_cache_dir=os.path.join(workdir, 'question_cache'))
+    bot = QuestionBot(write_config(workdir, 'send.json', config), True)
+    latencies = []
+    finished = threading.Event()
+
+    def callback(start):
+        def done(ok):
+            latencies.append(time.perf_counter() - start)
+            if len(latencies) == messages:
+                finished.set()
+        return done
+
+    start = time.perf_counter()
+    for i in range(messages):
+        bot.send_msg('text', {'content': f'benchmark message {i}'}, callback=callback(time.perf_counter()))
+    finished.wait()
+    report('send_msg', messages, time.perf_counter() - start, latencies)
+
+
+def bench_check_question(workdir, server, new_rows, runs):
+    config = dict(base_config(workdir, server, 'question'), questionnaire_url=server.base_url + '/questionnaire',
+                  question_cache_dir=os.path.join(workdir, 'question_cache'))
+    bot = QuestionBot(write_config(workdir, 'question.json', config), True)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        bot.state.update(bot.config_path, {'last_question_timestamp': server.watermark(new_rows)})
+        bot.poller.etag = None
+        # 每轮都当作新问题推送
+        bot.delivered.clear()
+        bot.state._execute('DELETE FROM questions WHERE owner = ?', (bot.config_path,))
+        begin = time.perf_counter()
+        bot.check_question()
+        latencies.append(time.perf_counter() - begin)
+    bot.sender.flush()
+    report(f'check_question ({new_rows} new)', runs, time.perf_counter() - start, latencies)
+
+
+def bench_inform(workdir, server, courses, shifts, runs):
+    monday = date.today() - timedelta(days=date.today().weekday())
+    rows = synthetic.timetable_rows(courses)
+    synthetic.write_csv(os.path.join(workdir, 'timetable.csv'), rows)
+    synthetic.write_csv(os.path.join(workdir, 'shift.csv'), synthetic.shift_rows(rows, monday, shifts))
+    synthetic.write_corpus(os.path.join(workdir, 'corpus.txt'))
+    config = dict(base_config(workdir, server, 'inform'),
+                  first_single_day=monday.strftime('%Y-%m-%d'),
+                  curricula_path=os.path.join(workdir, 'timetable.csv'),
+                  shifts_path=os.path.join(workdir, 'shift.csv'),
+                  corpus_path=os.path.join(workdir, 'corpus.txt'))
+    bot = CourseReMinderBot(write_config(workdir, 'inform.json', config), True)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        begin = time.perf_counter()
+        bot.inform()
+        latencies.append(time.perf_counter() - begin)
+    bot.sender.flush()
+    report(f'inform ({courses} courses)', runs, time.perf_counter() - start, latencies)
+
+
+def bench_check(workdir, courses, shifts, runs):
+    monday = date.today() - timedelta(days=date.today().weekday())
+    rows = synthetic.timetable_rows(courses, seed=1)
+    synthetic.write_csv(os.path.join(workdir, 'merged.csv'), rows)
+    synthetic.write_csv(os.path.join(workdir, 'merged_shift.csv'), synthetic.shift_rows(rows, monday, shifts, seed=1))
+    store = get_store(os.path.join(workdir, 'merged.csv'), os.path.join(workdir, 'merged_shift.csv'),
+                      os.path.join(workdir, 'corpus.txt'))
+    calendar = SemesterCalendar(monday, store)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        begin = time.perf_counter()
+        find_conflicts(calendar)
+        latencies.append(time.perf_counter() - begin)
+    report(f'--check ({courses} courses, {shifts} shifts)', runs, time.perf_counter() - start, latencies)
+
+
+def bench_timetable2csv(workdir, sheets):
+    workbook = os.path.join(workdir, 'timetable.xlsx')
+    output = os.path.join(workdir, 'timetable_out.csv')
+    synthetic.write_workbook(workbook, sheets)
+    for name, extra in [('timetable2csv', []), ('timetable2csv --incremental', ['--incremental'])]:
+        begin = time.perf_counter()
+        timetable2csv.main(['--input', workbook, '--output', output] + extra)
+        elapsed = time.perf_counter() - begin
+        report(f'{name} ({sheets} sheets)', 1, elapsed, [elapsed])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=2000, help='rows on the synthetic questionnaire page')
+    parser.add_argument('--new-rows', type=int, default=30)
+    parser.add_argument('--link-latency', type=float, default=0.05, help='seconds per question download')
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--shifts', type=int, default=200)
+    parser.add_argument('--sheets', type=int, default=12)
+    parser.add_argument('--check-courses', type=int, default=5000, help='courses in the merged timetable for --check')
+    parser.add_argument('--check-shifts', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(f'{"case":<40}{"ops":>8}{"ops/s":>12}{"p50 ms":>10}{"p99 ms":>10}{"rss MB":>10}')
+    with tempfile.TemporaryDirectory() as workdir, \
+            MockServer(rows=args.rows, link_latency=args.link_latency) as server:
+        bench_send(workdir, server, args.messages)
+        bench_check_question(workdir, server, args.new_rows, args.runs)
+        bench_inform(workdir, server, args.courses, args.shifts, args.runs)
+        bench_check(workdir, args.check_courses, args.check_shifts, args.runs)
+        bench_timetable2csv(workdir, args.sheets)
+        sender.flush_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 只在用到时才导入的模块，启动时出现在 sys.modules 中说明懒加载失效
+LAZY_MODULES = ('bs4', 'lxml', 'aiohttp', 'openpyxl', 'apscheduler.schedulers.asyncio')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# 在新进程中导入一次，返回 (墙钟耗时, -X importtime 统计的各模块累计耗时, 被提前导入的懒加载模块)
+def measure(module):
+    code = f'import sys, {module}; print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    wall = time.perf_counter() - start
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, us, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(us) / 1e6
+    loaded = [m for m in result.stdout.strip().split(',') if m]
+    return wall, cumulative, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='src.pbfx_main')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=400, help='fail if the median import time exceeds this')
+    parser.add_argument('--top', type=int, default=8, help='show the slowest imports of the last run')
+    args = parser.parse_args(argv)
+
+    walls, imports = [], []
+    for _ in range(args.runs):
+        wall, cumulative, loaded = measure(args.module)
+        walls.append(wall)
+        imports.append(cumulative[args.module])
+
+    print(f'{"case":<40}{"runs":>8}{"p50 ms":>10}{"p99 ms":>10}')
+    print(f'{"import " + args.module:<40}{args.runs:>8}{percentile(imports, 50) * 1000:>10.2f}'
+          f'{percentile(imports, 99) * 1000:>10.2f}')
+    print(f'{"interpreter + import":<40}{args.runs:>8}{percentile(walls, 50) * 1000:>10.2f}'
+          f'{percentile(walls, 99) * 1000:>10.2f}')
+    print()
+    for name, seconds in sorted(cumulative.items(), key=lambda x: -x[1])[1:args.top + 1]:
+        print(f'  {name:<50}{seconds * 1000:>10.2f}')
+
+    failed = False
+    if len(loaded) > 0:
+        print(f'lazy modules imported at startup: {", ".join(loaded)}')
+        failed = True
+    if percentile(imports, 50) * 1000 > args.budget_ms:
+        print(f'median import time exceeds the {args.budget_ms:.0f} ms budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
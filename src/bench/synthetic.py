@@ -0,0 +1,79 @@
+import random
+from datetime import timedelta
+
+import openpyxl
+
+WEEKDAYS = ['周' + i for i in ['一', '二', '三', '四', '五', '六', '日']]
+SLOTS = [('上午8:00-9:30', '08:00', '09:30'), ('上午10:00-11:30', '10:00', '11:30'),
+         ('下午1:00-2:30', '13:00', '14:30'), ('下午3:00-4:30', '15:00', '16:30'),
+         ('下午6:00-7:30', '18:00', '19:30')]
+STUDENTS = ['学生' + str(i) for i in range(200)]
+
+
+def questionnaire_page(rows, base_url, start, step=timedelta(minutes=7)):
+    lines = ['<html><body><div class="header">' + 'x' * 2000 + '</div>',
+             '<table class="table-content"><tr><th>提问</th><th>提交时间</th></tr>']
+    # 与金数据一致，新提交的排在前面
+    for i in reversed(range(rows)):
+        upload_time = (start + step * i).strftime('%Y-%m-%d %H:%M:%S')
+        lines.append(f'<tr><td><a href="{base_url}/q/{i}">问题 {i}</a></td>'
+                     f'<td><div title="{upload_time}">{upload_time}</div></td></tr>')
+    lines.append('</table></body></html>')
+    return '\n'.join(lines)
+
+
+def question_body(i, size=2000):
+    return f'### 问题 {i}\r\n' + ('这是一个关于课程内容的问题。' * (size // 14))
+
+
+def timetable_rows(courses, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(courses):
+        slot = rnd.choice(SLOTS)
+        rows.append([rnd.choice(['单', '双']), rnd.choice(WEEKDAYS), slot[0], f'教室{rnd.randrange(courses // 4 + 1)}',
+                     f'课程{i}（师{rnd.randrange(courses // 3 + 1) % 1000:03d}）', '、'.join(rnd.sample(STUDENTS, 3))])
+    return rows
+
+
+def shift_rows(timetable, first_day, shifts, weeks=18, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(shifts):
+        single, weekday, slot, place, course, _students = rnd.choice(timetable)
+        source_slot = next(i for i in SLOTS if i[0] == slot)
+        week = rnd.randrange(weeks // 2) * 2 + (0 if single == '单' else 1)
+        source = first_day + timedelta(days=week * 7 + WEEKDAYS.index(weekday) - first_day.weekday())
+        target = source + timedelta(days=rnd.randrange(1, 7))
+        target_slot = rnd.choice(SLOTS)
+        rows.append([course.split('（')[0], source.strftime('%Y-%m-%d'), source_slot[1], source_slot[2], place,
+                     target.strftime('%Y-%m-%d'), target_slot[1], target_slot[2], f'教室{rnd.randrange(50)}'])
+    return rows
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='UTF-8') as f:
+        for row in rows:
+            print(','.join(row), file=f)
+
+
+def write_corpus(path):
+    with open(path, 'w', encoding='UTF-8') as f:
+        for i in range(20):
+            print(f'早安{i}', file=f)
+
+
+# 与 sample 中的排课表格式相同：第一行教室，第二行星期，之后每两行是一个时间段的课程和学生
+def write_workbook(path, sheets, rooms=20, seed=0):
+    rnd = random.Random(seed)
+    book = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        sheet = book.create_sheet(f'排课{s}（{"单" if s % 2 == 0 else "双"}）')
+        sheet.append(['教室'] + [f'教室{j // 2}' if j % 2 == 0 else None for j in range(rooms)])
+        sheet.append([None] + [rnd.choice(WEEKDAYS[4:]) for _ in range(rooms)])
+        for slot in SLOTS:
+            courses = [f'课程{rnd.randrange(1000)}（师{rnd.randrange(1000):03d}）' if rnd.random() < 0.6 else None
+                       for _ in range(rooms)]
+            sheet.append([slot[0]] + courses)
+            sheet.append([None] + ['、'.join(rnd.sample(STUDENTS, 3)) if c is not None else None for c in courses])
+    book.save(path)
@@ -6,10 +6,35 @@ from src.utils.bot import *
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--test", action='store_true')
+    parser.add_argument("--engine", choices=['blocking', 'asyncio'], default='blocking')
+    parser.add_argument("--groups", type=str, default=None,
+                        help='directory with one sub-directory of bot configs per study group')
+    parser.add_argument("--metrics-port", type=int, default=None, help='serve Prometheus metrics on this port')
+    parser.add_argument("--metrics-dump", type=int, default=None, help='log a metrics summary every N minutes')
+    parser.add_argument("--lease-ttl", type=float, default=15,
+                        help='seconds before a standby replica takes over the groups of a crashed one')
+    parser.add_argument("--max-groups", type=int, default=None, help='lead at most this many groups in this replica')
+    parser.add_argument("--check", action='store_true',
+                        help='check timetables and shifts for double-booked rooms, teachers and students, then exit')
     args = parser.parse_args()
 
-    course_reminder_bot = CourseReMinderBot("config/course_reminder_bot_config.json", args.test)
-    course_reminder_bot.schedule()
-    question_bot = QuestionBot("config/question_bot_config.json", args.test)
-    question_bot.schedule()
-    start()
+    use_engine(args.engine)
+    if not args.check:
+        use_leases(args.lease_ttl, args.max_groups)
+    if args.groups is not None:
+        bots = load_groups(args.groups, args.test)
+    else:
+        bots = [CourseReMinderBot("config/course_reminder_bot_config.json", args.test),
+                QuestionBot("config/question_bot_config.json", args.test)]
+    if args.check:
+        problems = 0
+        for bot in bots:
+            if isinstance(bot, CourseReMinderBot):
+                for problem in bot.check_timetable():
+                    print(f'{bot.config_path}: {problem}')
+                    problems += 1
+        print(f'{problems} problems found')
+        exit(1 if problems > 0 else 0)
+    for bot in bots:
+        bot.schedule()
+    start(args.metrics_port, args.metrics_dump)
@@ -0,0 +1,46 @@
+from src.utils.cache import CHUNK_SIZE
+
+# asyncio 引擎下共享的 HTTP 会话，需要在事件循环内创建
+_session = None
+
+
+def session():
+    global _session
+    # aiohttp 导入较慢，只在 asyncio 引擎下用到时才导入
+    import aiohttp
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=32),
+                                         timeout=aiohttp.ClientTimeout(total=30))
+    return _session
+
+
+async def get_text(url):
+    async with session().get(url) as r:
+        r.raise_for_status()
+        return await r.text(encoding='utf-8')
+
+
+async def post_json(url, payload):
+    async with session().post(url, json=payload) as r:
+        return await r.json(content_type=None)
+
+
+async def download(item, cache=None):
+    if cache is None:
+        return await get_text(item['href'])
+    url = item['href']
+    text = cache.get(url)
+    if text is not None:
+        return text
+    async with session().get(url, headers=cache.validators(url)) as r:
+        if r.status == 304:
+            return cache.get(url, revalidated=True)
+        r.raise_for_status()
+        writer = cache.writer(url)
+        try:
+            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(r.headers.get('ETag'))
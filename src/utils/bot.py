@@ -1,47 +1,86 @@
-import json
+import asyncio
+import atexit
+import functools
+import hashlib
 import logging
+import os
 import random
-import requests
-import re
 import sys
-import urllib3
+import time
+import uuid
 
 from abc import abstractmethod
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.blocking import BlockingScheduler
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta, time
-from dateutil import tz
-from tqdm.contrib.concurrent import process_map
-
-from src.utils import util
-from src.utils.curriculum import Curriculum, Shift, ShiftInfo, cal_single
-
-
-def start():
+from datetime import datetime, timedelta
+
+from src.utils import config, metrics, util
+from src.utils.cache import get_content_cache
+from src.utils.config import ConfigError
+from src.utils.conflicts import find_conflicts
+from src.utils.fetch import get_fetch_pool
+from src.utils.lease import LeaseManager
+from src.utils.planner import ReminderPlanner
+from src.utils.poller import QuestionnairePoller
+from src.utils.semester import CalendarTrigger, SemesterCalendar, check_trigger, daily_trigger, weekly_trigger
+from src.utils.sender import get_sender
+from src.utils.state import get_state
+from src.utils.template import get_templates
+from src.utils.timetable import get_store
+from src.utils.watcher import get_watcher
+
+
+def use_engine(engine):
+    Bot.engine = engine
+    if engine == 'asyncio':
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        Bot.scheduler = AsyncIOScheduler(timezone='Asia/Shanghai', event_loop=loop)
+
+
+# 启用租约后多个副本可以同时运行，每个组只由持有租约的副本执行任务
+def use_leases(ttl=15, max_groups=None):
+    Bot.leases = LeaseManager(ttl, max_groups)
+
+
+def start(metrics_port=None, metrics_dump_minutes=None):
+    if Bot.leases is not None:
+        Bot.leases.start()
+        atexit.register(Bot.leases.release_all)
+    metrics.install(Bot.scheduler)
+    if metrics_port is not None:
+        metrics.serve(metrics_port)
+    if metrics_dump_minutes is not None:
+        Bot.scheduler.add_job(metrics.dump, 'interval', minutes=metrics_dump_minutes, id='metrics_dump')
+    get_watcher().start()
     Bot.scheduler.print_jobs()
     Bot.scheduler.start()
+    if Bot.engine == 'asyncio':
+        try:
+            asyncio.get_event_loop().run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
 
 
 class Bot:
+    engine = 'blocking'
+    schema = config.BOT_SCHEMA
     scheduler = BlockingScheduler(timezone='Asia/Shanghai')
+    leases = None
 
-    def __init__(self, config_path: str, test_flag: bool):
+    def __init__(self, config_path: str, test_flag: bool, group=None):
         self.config_path = config_path
         self.test = test_flag
+        self.group = group
 
         try:
-            self.config = json.load(open(config_path, 'r'))
-            if test_flag:
-                assert self.config['test_access_token'] is not None
-                assert self.config['test_secret'] is not None
-            else:
-                assert self.config['access_token'] is not None
-                assert self.config['secret'] is not None
+            self.config = self.read_config()
         except FileNotFoundError:
             logging.critical(config_path + ' not found!')
             exit(1)
-        except AssertionError:
-            logging.critical('invalid config file: ' + config_path)
+        except ConfigError as e:
+            logging.critical(f'invalid config file: {config_path} ({e})')
             exit(1)
 
         if test_flag:
@@ -52,32 +91,103 @@ class Bot:
                                 level=logging.INFO,
                                 format='%(asctime)s - %(levelname)s - %(message)s')
 
-    # 向钉钉群推送消息
-    def send_msg(self, msg_type, content, at=None):
-        if at is None:
-            at = {}
-        http = urllib3.PoolManager()
-
-        access_token = self.config['test_access_token'] if self.test else self.config['access_token']
-        timestamp = str(round(datetime.now(tz.gettz('Asia/Shanghai')).timestamp() * 1000))
-        sign = util.get_sign(self.config['test_secret'] if self.test else self.config['secret'], timestamp)
-
-        r = http.request('POST',
-                         f"https://oapi.dingtalk.com/robot/send?access_token={access_token}&timestamp={timestamp}&sign={sign}",
-                         headers={
-                             "Content-Type": "application/json",
-                         },
-                         body=json.dumps({
-                             "msgtype": msg_type,
-                             msg_type: content,
-                             "at": at
-                         }))
-        result = json.loads(r.data)
-        if str(result['errcode']) == '0':
-            logging.info(f'Snapshot:\n{str(content)[0:50]}...\n推送成功!')
+        self.configure()
+        self.lease_name = f'group:{group if group is not None else "default"}'
+        if Bot.leases is not None:
+            Bot.leases.register(self.lease_name, self.state, self.on_leader)
+
+    # 按各机器人的配置表读取并检查配置文件，缺省的配置项补全默认值
+    def read_config(self):
+        return config.load(self.config_path, self.schema, self.test)
+
+    # 根据配置创建推送队列等，重新加载配置时再次调用
+    def configure(self):
+        self.sender = get_sender(self.config['test_access_token'] if self.test else self.config['access_token'],
+                                 self.config['test_secret'] if self.test else self.config['secret'],
+                                 engine=Bot.engine,
+                                 url=self.config['webhook_url'],
+                                 rate=self.config['rate_limit'],
+                                 merge_markdown=self.config['merge_markdown'])
+        self.state = get_state(self.config['state_path'])
+        self.templates = get_templates(self.config['language'], self.config['templates'])
+        get_watcher().watch(self.config_path, self.config_path, self.on_config_changed)
+
+    # 文件监视线程只提交任务，重新加载在调度器中执行
+    def on_config_changed(self, path):
+        self.add_job(self.reload_config, 'date', id=f'reload_config:{self.config_path}', replace_existing=True,
+                     leader_only=False)
+
+    # 配置有误时保留原配置继续运行；固定 id 的定时任务重新调度后原地替换
+    def reload_config(self):
+        try:
+            new_config = self.read_config()
+        except (OSError, ConfigError) as e:
+            logging.error(f'reload {self.config_path} failed, keep current config ({e})')
+            return
+        if new_config == self.config:
+            return
+        self.config = new_config
+        self.configure()
+        if not self.test:
+            self.schedule()
+        logging.info(f'{self.config_path} reloaded')
+
+    # 向钉钉群推送消息，实际发送由共享的限流队列完成，结果记入推送记录
+    def send_msg(self, msg_type, content, at=None, callback=None):
+        def done(ok):
+            self.state.record(self.config_path, msg_type, content, ok)
+            if callback is not None:
+                callback(ok)
+
+        self.sender.send(msg_type, content, at, done)
+
+    def is_leader(self):
+        return Bot.leases is None or Bot.leases.is_leader(self.lease_name)
+
+    # 成为主副本时在调度器中执行 take_over，接上原主副本留下的状态
+    def on_leader(self):
+        self.add_job(self.take_over, 'date', id=f'take_over:{self.config_path}', replace_existing=True,
+                     leader_only=False)
+
+    def take_over(self):
+        pass
+
+    # asyncio 引擎下把同步任务包装成协程，直接在事件循环中执行
+    # 任务 id 以任务名开头，按任务名统计调度延迟和耗时
+    # leader_only 的任务只在本组的主副本上执行，其他副本跳过
+    def add_job(self, func, trigger, leader_only=True, **kwargs):
+        kwargs.setdefault('id', f'{func.__name__}:{uuid.uuid4().hex}')
+        label = metrics.job_label(kwargs['id'])
+        job_func = func
+
+        def standby():
+            if leader_only and not self.is_leader():
+                logging.debug(f'skip {kwargs["id"]}: not the leader of {self.lease_name}')
+                return True
+            return False
+
+        if asyncio.iscoroutinefunction(job_func):
+            @functools.wraps(job_func)
+            async def func(*args, **kw):
+                if standby():
+                    return
+                with metrics.timer('job_duration_seconds', job=label):
+                    return await job_func(*args, **kw)
+        elif Bot.engine == 'asyncio':
+            @functools.wraps(job_func)
+            async def func(*args, **kw):
+                if standby():
+                    return
+                with metrics.timer('job_duration_seconds', job=label):
+                    return job_func(*args, **kw)
         else:
-            logging.error(f'Snapshot:\n{str(content)[0:50]}...\n推送失败!')
-            logging.error(result)
+            @functools.wraps(job_func)
+            def func(*args, **kw):
+                if standby():
+                    return
+                with metrics.timer('job_duration_seconds', job=label):
+                    return job_func(*args, **kw)
+        return Bot.scheduler.add_job(func, trigger, **kwargs)
 
     @abstractmethod
     def schedule(self):
@@ -85,296 +195,325 @@ class Bot:
 
 
 class QuestionBot(Bot):
-
-    def __init__(self, config_path: str, test_flag: bool):
-        super(QuestionBot, self).__init__(config_path, test_flag)
-
-        try:
-            assert self.config['questionnaire_url'] is not None
-        except AssertionError:
-            logging.critical('invalid config file: ' + config_path)
-            exit(1)
-
+    schema = config.QUESTION_BOT_SCHEMA
+
+    def __init__(self, config_path: str, test_flag: bool, group=None):
+        # 本进程已认领、还在推送队列中的问题，重新加载配置后保留
+        self.in_flight = set()
+        super(QuestionBot, self).__init__(config_path, test_flag, group)
+
+    def configure(self):
+        super(QuestionBot, self).configure()
+        self.poller = QuestionnairePoller(self.config['questionnaire_url'],
+                                          etag=self.state.get(self.config_path, 'questionnaire_etag'),
+                                          last_modified=self.state.get(self.config_path,
+                                                                       'questionnaire_last_modified'))
+        self.delivered = self.state.delivered_questions(self.config_path)
+        self.fetch_pool = get_fetch_pool(max_workers=self.config['download_workers'],
+                                         timeout=self.config['download_timeout'])
+        self.cache = get_content_cache(self.config['question_cache_dir'],
+                                       memory_bytes=self.config['question_cache_memory_mb'] << 20,
+                                       disk_bytes=self.config['question_cache_disk_mb'] << 20,
+                                       max_age=self.config['question_cache_max_age'])
+
+    # 配置文件中的 last_question_timestamp 只作为首次运行时的初始值
+    # 有尚未推送成功的问题时从其中最早的一个开始扫描
     def get_last_question_time(self):
-        if self.config.get('last_question_timestamp') is None:
-            return None
+        last_time = self.state.get(self.config_path, 'last_question_timestamp',
+                                   self.config['last_question_timestamp'])
+        last_time = util.parse_time(last_time) if last_time is not None else None
+        unfinished = self.state.oldest_unfinished_question(self.config_path)
+        if unfinished is not None:
+            unfinished = datetime.fromtimestamp(unfinished, util.TZ)
+            if last_time is None or unfinished < last_time:
+                return unfinished
+        return last_time
+
+    # 按时间顺序推送下载成功的问题，下载失败的问题记为失败，下次检查时重试，不影响其他问题
+    # 每个问题先认领再推送，已推送过的链接或内容相同的问题不会重复推送
+    # 推送队列积压时本进程认领的问题可能很久仍未发出，
+    # 这些问题记在 in_flight 中，不会因超过 question_claim_timeout 被当作崩溃遗留重新认领
+    def deliver_questions(self, data, questions):
+        failed = 0
+        stale_before = time.time() - self.config['question_claim_timeout']
+        for item, question in zip(data, questions):
+            href = item['href']
+            if href in self.in_flight:
+                logging.debug(f'question {href} is waiting in the sender queue')
+                continue
+            digest = hashlib.sha1(question.encode('utf-8')).hexdigest() if question is not None else None
+            status = self.state.claim_question(self.config_path, href, item['time'], digest, stale_before)
+            if status is None:
+                logging.info(f'question {href} is handled by another check')
+                continue
+            if status == 'duplicate':
+                logging.info(f'question {href} duplicates a delivered or pending question')
+                self.delivered.add(href)
+                continue
+            if question is None:
+                failed += 1
+                self.question_failed(href)
+                continue
+            self.in_flight.add(href)
+            self.send_msg('markdown', {
+                "title": self.templates.render('question_title', time=item["time"].strftime("%Y-%m-%d %H:%M:%S")),
+                "text": question.replace('\r\n', '\n') + f'\n'
+            }, callback=functools.partial(self.question_sent, href))
+
+        if failed > 0:
+            logging.warning(f'{failed} questions failed to download, retry at next check')
+        # 还有问题在推送中或推送失败时不记录校验信息，下次检查重新获取页面
+        if self.state.oldest_unfinished_question(self.config_path) is None:
+            self.poller.commit()
+            self.state.update(self.config_path, {
+                'questionnaire_etag': self.poller.etag,
+                'questionnaire_last_modified': self.poller.last_modified
+            })
+        # 水位取最后一个问题的提交时间而不是检查时的时间，检查期间提交的问题不会漏掉
+        # 失败的问题由 oldest_unfinished_question 从更早的位置重新扫描，重试时水位不后退
+        if len(data) > 0:
+            last_time = self.state.get(self.config_path, 'last_question_timestamp')
+            if last_time is None or util.parse_time(last_time) < data[-1]['time']:
+                self.state.update(self.config_path, {
+                    'last_question_timestamp': data[-1]['time'].strftime("%Y-%m-%d %H:%M:%S")
+                })
+
+    def question_sent(self, href, ok):
+        self.in_flight.discard(href)
+        if ok:
+            self.state.finish_question(self.config_path, href, 'delivered')
+            self.delivered.add(href)
         else:
-            return util.parse_time(self.config['last_question_timestamp'])
+            self.question_failed(href)
+
+    # 多次下载或推送失败的问题不再重试，以免一直从它开始扫描
+    def question_failed(self, href):
+        max_attempts = self.config['question_max_attempts']
+        if self.state.fail_question(self.config_path, href, max_attempts) == 'abandoned':
+            logging.error(f'question {href} failed {max_attempts} times, give up')
+            self.delivered.add(href)
 
     def check_question(self):
         # recover from network failure
         try:
             last_time = self.get_last_question_time()
-            current_time = datetime.now(tz.gettz('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
-            data_url = self.config['questionnaire_url']
-            page = requests.get(data_url).content.decode(encoding='UTF-8')
-            soup = BeautifulSoup(page, features="html.parser")
-            table = soup.find(attrs={'class': 'table-content'}).find_all('tr')[1:]
-
-            data = []
-            for row in table:
-                href = ''
-                upload_time = None
-                for column in row.find_all('td'):
-                    result = column.find('a')
-                    if result is not None:
-                        href = result.attrs['href']
-                    else:
-                        result = column.find('div')
-                        upload_time = util.parse_time(result.attrs['title'])
-                if last_time is None or last_time < upload_time:
-                    data.append({
-                        'href': href,
-                        'time': upload_time
-                    })
-
-            logging.info(f'Got {len(data)} new questions')
-            questions = process_map(util.download, data)
-
-            for i in range(len(questions)):
-                self.send_msg('markdown', {
-                    "title": f'[朋辈辅学] {data[i]["time"].strftime("%Y-%m-%d %H:%M:%S")}',
-                    "text": questions[i].replace('\r\n', '\n') + f'\n'
-                })
-
-            self.config['last_question_timestamp'] = current_time
-            json.dump(self.config, open(self.config_path, 'w'))
-
-            next_check_time = self.get_next_check_time()
-            Bot.scheduler.add_job(self.check_question, 'date', next_run_time=next_check_time)
-        except ...:
-            pass
+            with metrics.timer('question_stage_seconds', stage='fetch'):
+                page = self.poller.fetch()
+            if page is not None:
+                with metrics.timer('question_stage_seconds', stage='parse'):
+                    data = self.poller.parse(page, last_time, self.delivered)
+                logging.info(f'Got {len(data)} new questions')
+                with metrics.timer('question_stage_seconds', stage='download'):
+                    questions = self.fetch_pool.download_all(data, self.cache)
+                self.deliver_questions(data, questions)
+        except Exception:
+            logging.exception('check question failed')
+
+    async def check_question_async(self):
+        try:
+            last_time = self.get_last_question_time()
+            with metrics.timer('question_stage_seconds', stage='fetch'):
+                page = await self.poller.fetch_async()
+            if page is not None:
+                with metrics.timer('question_stage_seconds', stage='parse'):
+                    data = self.poller.parse(page, last_time, self.delivered)
+                logging.info(f'Got {len(data)} new questions')
+                with metrics.timer('question_stage_seconds', stage='download'):
+                    questions = await self.fetch_pool.download_all_async(data, self.cache)
+                self.deliver_questions(data, questions)
+        except Exception:
+            logging.exception('check question failed')
+
+    # 已推送的问题和页面校验信息以状态库为准
+    def take_over(self):
+        self.delivered = self.state.delivered_questions(self.config_path)
+        self.poller.etag = self.state.get(self.config_path, 'questionnaire_etag')
+        self.poller.last_modified = self.state.get(self.config_path, 'questionnaire_last_modified')
+
+    def check_job(self):
+        return self.check_question_async if Bot.engine == 'asyncio' else self.check_question
 
     def raise_question(self):
         self.send_msg('text', {
-            "title": f'[朋辈辅学问题收集】',
-            "content": "又到周末啦，相信大家都过了充实的一周呢~\n"
-                       "小朋友们有没有遇到新的问题呀，欢迎大家随时提问~\n"
-                       "[提问链接]https://jinshuju.net/f/xW193K\n"
-                       "祝大家周末愉快！[撒花]"
+            "title": self.templates.render('raise_question_title'),
+            "content": self.templates.render('raise_question')
         })
-        next_raise_time = self.get_next_question_time()
-        Bot.scheduler.add_job(self.raise_question, 'date', next_run_time=next_raise_time)
-
-    def get_next_question_time(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
-        weekday, hour = current_time.weekday(), current_time.hour
-        if weekday != 4:  # Not Friday
-            day_to_friday = (11 - weekday) % 7
-            next_raise_time = datetime.combine(current_time.date() + timedelta(days=day_to_friday), time(18, 0, 0))
-        else:
-            if hour < 18:
-                next_raise_time = datetime.combine(current_time.date(), time(18, 0, 0))
-            else:
-                next_raise_time = datetime.combine(current_time.date() + timedelta(days=7), time(18, 0, 0))
-        return next_raise_time
-
-    def get_next_check_time(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
-        hour, minute = current_time.hour, current_time.minute
-        if hour < 16:
-            next_check_time = datetime.combine(current_time.date(), time(16, 0, 0))
-        elif hour < 22:
-            if minute >= 50:
-                next_check_time = datetime.combine(current_time.date(), time(hour + 1, 0, 0))
-            else:
-                next_check_time = datetime.combine(current_time.date(), time(hour, (minute // 10 + 1) * 10, 0))
-        else:  # hour >= 22
-            next_check_time = datetime.combine(current_time.date() + timedelta(days=1), time(16, 0, 0))
-        return next_check_time
 
     def schedule(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
+        current_time = datetime.now(util.TZ)
         if self.test:
-            Bot.scheduler.add_job(self.raise_question, 'date', next_run_time=current_time)
-            Bot.scheduler.add_job(self.check_question, 'interval', minutes=3, next_run_time=current_time)
+            self.add_job(self.raise_question, 'date', next_run_time=current_time)
+            self.add_job(self.check_job(), 'interval', minutes=3, next_run_time=current_time)
         else:
-            next_question_time = self.get_next_question_time()
-            Bot.scheduler.add_job(self.raise_question, 'date', next_run_time=next_question_time)
-
-            next_check_time = self.get_next_check_time()
-            Bot.scheduler.add_job(self.check_question, 'date', next_run_time=next_check_time)
+            self.add_job(self.raise_question, weekly_trigger('fri', 18), id=f'raise_question:{self.config_path}',
+                         replace_existing=True, coalesce=True, misfire_grace_time=3600)
+            self.add_job(self.check_job(), check_trigger(), id=f'check_question:{self.config_path}',
+                         replace_existing=True, coalesce=True, misfire_grace_time=300)
 
 
 class CourseReMinderBot(Bot):
+    schema = config.COURSE_REMINDER_BOT_SCHEMA
 
-    def __init__(self, config_path: str, test_flag: bool):
-        super(CourseReMinderBot, self).__init__(config_path, test_flag)
-        self.start_time = datetime.now(tz.gettz('Asia/Shanghai'))  # used for check 单双周
+    def __init__(self, config_path: str, test_flag: bool, group=None):
+        super(CourseReMinderBot, self).__init__(config_path, test_flag, group)
+        self.start_time = datetime.now(util.TZ)  # used for check 单双周
         self.class_list = []
 
-        try:
-            assert self.config['first_single_day'] is not None
-            assert self.config['corpus_path'] is not None
-            assert self.config['curricula_path'] is not None
-            assert self.config['shifts_path'] is not None
-        except AssertionError:
-            logging.critical('invalid config file: ' + config_path)
-            exit(1)
+    def configure(self):
+        super(CourseReMinderBot, self).configure()
+        self.store = get_store(self.config['curricula_path'], self.config['shifts_path'], self.config['corpus_path'])
+        self.calendar = SemesterCalendar(datetime.strptime(self.config['first_single_day'], '%Y-%m-%d').date(),
+                                         self.store, weeks=self.config['semester_weeks'],
+                                         inform_days=self.config['inform_days'])
+        self.checked_version = None
+        self.planner = ReminderPlanner(self.config_path, self.calendar, self.templates, self.config['lookahead_days'])
+        watcher = get_watcher()
+        watcher.unwatch(f'{self.config_path}:timetable')
+        for key in ('curricula_path', 'shifts_path', 'corpus_path'):
+            watcher.watch(self.config[key], f'{self.config_path}:timetable', self.on_timetable_changed)
+
+    # 课表或调课文件变化后立即重新规划受影响的提醒，不必等到第二天
+    # 调课可能增加需要发送早安消息的日子，早安消息任务也重新计算下一次发送时间
+    def on_timetable_changed(self, path):
+        self.add_job(self.plan_reminders, 'date', id=f'replan_reminders:{self.config_path}', replace_existing=True)
+        if not self.test:
+            self.schedule_inform()
+
+    def schedule_inform(self):
+        self.add_job(self.inform, CalendarTrigger(self.calendar, 8), id=f'inform:{self.config_path}',
+                     replace_existing=True, coalesce=True, misfire_grace_time=3600)
 
-    def get_corpus(self):
+    def inform(self):
+        current_time = datetime.now(util.TZ)
         try:
-            with open(self.config['corpus_path'], 'r', encoding='UTF-8') as f:
-                return list(filter(lambda x: x != '', [line.strip() for line in f.readlines()]))
+            corpus = self.store.corpus
         except FileNotFoundError:
             logging.critical('file not found: ' + self.config['corpus_path'])
             exit(1)
 
-    def get_curricula(self):
-        curricula = []
-        weekdays = ['周' + i for i in ['一', '二', '三', '四', '五', '六', '日']]
-        try:
-            with open(self.config['curricula_path'], 'r', encoding='UTF-8') as f:
-                for line in f.readlines():
-                    line = line.strip().split(',')
-                    is_single = line[0] == '单'
-                    weekday = weekdays.index(line[1])
-                    start_h, start_m, end_h, end_m = [int(i) for i in re.compile(r'(\d{1,2})').findall(line[2])]
-                    if re.search(r'上午', line[2]) is None:
-                        start_h += 12
-                        end_h += 12
-                    place = line[3]
-                    course = re.compile(r'(.+)（.{2,4}）').findall(line[4])[0]
-                    teacher = re.compile(r'（(.{2,4})）').findall(line[4])[0]
-                    students = line[5].split('、')
-                    start = time(start_h, start_m, 0, 0)
-                    end = time(end_h, end_m, 0, 0)
-                    curricula.append(Curriculum(is_single, weekday, start, end, place, course, teacher, students))
-        except FileNotFoundError:
-            pass
-        return curricula
-
-    def get_shifts(self):
-        shifts = []
-        try:
-            with open(self.config['shifts_path'], 'r', encoding='UTF-8') as f:
-                for line in f.readlines():
-                    line = line.strip().split(',')
-                    source, target = ShiftInfo(*line[0:5]), ShiftInfo(line[0], *line[5:9])
-                    shifts.append(Shift(source, target))
-        except FileNotFoundError:
-            pass
-        return shifts
+        self.class_list = self.calendar.classes_on(current_time.date())
 
-    def inform(self):
-        curricula = self.get_curricula()
-        shifts = self.get_shifts()
-        corpus = self.get_corpus()
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
-        weekday = current_time.date().weekday()
-
-        self.class_list = sorted(list(filter(lambda x: x.date >= current_time.date(), self.class_list)))
-
-        first_single_day = datetime.strptime(self.config['first_single_day'], '%Y-%m-%d').date()
-        is_single_now = cal_single(first_single_day, True, current_time.date())
-        for curriculum in curricula:
-            if curriculum.is_single == is_single_now and curriculum.weekday == weekday:
-                self.class_list.append(curriculum.get_class(current_time.date()))
-
-        for shift in shifts:
-            source = shift.source
-            target = shift.target
-            # 当日课程调换到后面
-            for i in self.class_list:
-                if source.course == i.name and source.date == i.date and source.start == i.start and source.place == i.place:
-                    logging.info(
-                        f'{i.name} shifted from {i.date.strftime("%Y-%m-%d")} {i.start.strftime("%H:%M")} to {target.date.strftime("%Y-%m-%d")} {target.start.strftime("%H:%M")}')
-                    i.date = target.date
-                    i.start = target.start
-                    i.end = target.end
-                    i.place = target.place
-                    i.shifted = True
-
-            # 其他课程调换到今天
-            if target.date == current_time.date():
-                for i in curricula:
-                    if i.name == source.course and i.weekday == source.date.weekday() and i.start == source.start and i.place == source.place:
-                        logging.info(
-                            f'{i.name}（{i.place}） shifted from {source.date.strftime("%Y-%m-%d")} {i.start.strftime("%H:%M")} to {target.date.strftime("%Y-%m-%d")} {target.start.strftime("%H:%M")}')
-                        new_class = i.get_class(current_time.date())
-                        new_class.start = shift.target.start
-                        new_class.end = shift.target.end
-                        new_class.place = shift.target.place
-                        new_class.shifted = True
-                        self.class_list.append(new_class)
-
-        class_list = list(set(self.class_list))
-        today_class = sorted(list(filter(lambda x: x.date == current_time.date(), class_list)))
+        today_class = self.class_list
         if len(today_class) > 0:
             self.send_msg('text', {
-                'content': f'早安[比心], 今天一共有{len(today_class)}门课:\n\n' + '\n'.join([
-                    f'{i + 1}. {cur.name + ("（调课）" if cur.shifted else "")}[{cur.teacher}][{cur.place}, {cur.start.strftime("%H:%M")} - {cur.end.strftime("%H:%M")}]\n学生: {"、".join(cur.students)}\n'
+                'content': self.templates.render('inform_header', count=str(len(today_class))) + '\n'.join([
+                    self.templates.render_class('inform_class', cur, index=str(i + 1))
                     for i, cur in enumerate(today_class)
-                ]) + '\n大家要准时上课哦[天使]'
+                ]) + self.templates.render('inform_footer')
             }, at={'isAtAll': True})
         else:
             self.send_msg('text', {
                 'content': random.choice(corpus)
             })
 
-        for i in today_class:
-            Bot.scheduler.add_job(
-                self.send_msg, 'date',
-                next_run_time=datetime.combine(i.date, i.start, tzinfo=tz.gettz('Asia/Shanghai')) - timedelta(
-                    minutes=15),
-                args=['text', {
-                    'content': f'课程: {i.name}[{i.teacher}][{i.place}, {i.start.strftime("%H:%M")}-{i.end.strftime("%H:%M")}]即将开始，老师同学们不要忘啦[微笑]'
-                }])
-        next_inform_time = self.get_next_inform_time()
-        Bot.scheduler.add_job(self.inform, 'date', next_run_time=next_inform_time)
+        self.plan_reminders()
+
+    # 课表或调课文件加载、修改后检查冲突，只记录警告，不影响提醒
+    def check_timetable(self):
+        self.checked_version = self.store.version
+        problems = find_conflicts(self.calendar)
+        for problem in problems:
+            logging.warning(f'{self.config_path}: {problem}')
+        return problems
+
+    # 规划未来 lookahead_days 天（包括不发早安消息的日子）的课程提醒
+    def plan_reminders(self):
+        if self.store.version != self.checked_version:
+            self.check_timetable()
+        pending = {reminder_id: (run_time, content) for reminder_id, run_time, _, content in
+                   self.state.pending_reminders(self.config_path)}
+        planned, cancelled = self.planner.plan(datetime.now(util.TZ), pending)
+        for reminder_id in cancelled:
+            self.cancel_reminder(reminder_id)
+        for reminder_id, (run_time, content) in planned.items():
+            self.add_reminder(reminder_id, run_time, content)
+        if len(planned) > 0 or len(cancelled) > 0:
+            logging.info(f'Planned {len(planned)} reminders, cancelled {len(cancelled)} until '
+                         f'{self.planner.until.strftime("%Y-%m-%d")}')
+
+    # 提醒先写入状态库再加入调度器，重启后由 restore_reminders 恢复
+    def add_reminder(self, reminder_id, run_time, content):
+        self.state.add_reminder(reminder_id, self.config_path, run_time, 'text', content)
+        self.add_job(self.fire_reminder, 'date', id=reminder_id, replace_existing=True, next_run_time=run_time,
+                     args=[reminder_id, 'text', content])
+
+    def cancel_reminder(self, reminder_id):
+        logging.info(f'reminder {reminder_id} cancelled')
+        self.state.set_reminder_status(reminder_id, 'cancelled')
+        try:
+            Bot.scheduler.remove_job(reminder_id)
+        except JobLookupError:
+            pass
+
+    def fire_reminder(self, reminder_id, msg_type, content):
+        # 先标记为发送中，推送途中崩溃重启或其他副本同时触发时不会重复提醒
+        if not self.state.claim_reminder(reminder_id):
+            logging.info(f'reminder {reminder_id} already handled')
+            return
+        self.send_msg(msg_type, content,
+                      callback=lambda ok: self.state.set_reminder_status(reminder_id, 'sent' if ok else 'failed'))
+
+    def restore_reminders(self):
+        current_time = datetime.now(util.TZ)
+        grace = timedelta(minutes=self.config['reminder_grace_minutes'])
+        restored = 0
+        for reminder_id, run_time, msg_type, content in self.state.pending_reminders(self.config_path):
+            run_time = datetime.fromtimestamp(run_time, util.TZ)
+            if run_time < current_time - grace:
+                logging.warning(f'reminder {reminder_id} missed at {run_time.strftime("%Y-%m-%d %H:%M")}')
+                self.state.set_reminder_status(reminder_id, 'missed')
+                continue
+            self.add_job(self.fire_reminder, 'date', id=reminder_id, replace_existing=True,
+                         next_run_time=max(run_time, current_time), args=[reminder_id, msg_type, content])
+            restored += 1
+        logging.info(f'Restored {restored} reminders')
+
+    # 原主副本规划、取消的提醒都在状态库中，接管时从状态库恢复再补充规划
+    def take_over(self):
+        self.restore_reminders()
+        self.plan_reminders()
 
     def raise_feedback(self):
         self.send_msg('text', {
-            "title": f'[朋辈辅学反馈收集】',
-            "content": "本周的课程都结束啦~\n"
-                       "欢迎大家填写问卷反馈[送花花]\n"
-                       "[反馈连接]https://jinshuju.net/f/C8nzMm"
+            "title": self.templates.render('raise_feedback_title'),
+            "content": self.templates.render('raise_feedback')
         })
-        next_feedback_time = self.get_next_feedback_time()
-        Bot.scheduler.add_job(self.raise_feedback, 'date', next_run_time=next_feedback_time)
-
-    def get_next_inform_time(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
-        week_day, hour = current_time.weekday(), current_time.hour
-        if week_day < 4:  # Monday - Thursday
-            day_to_friday = (11 - week_day) % 7
-            next_inform_time = datetime.combine(current_time.date() + timedelta(days=day_to_friday), time(8, 0, 0))
-        elif 4 <= week_day < 6:
-            if hour < 8:
-                next_inform_time = datetime.combine(current_time.date(), time(8, 0, 0))
-            else:
-                next_inform_time = datetime.combine(current_time.date() + timedelta(days=1), time(8, 0, 0))
-        else:  # Sunday
-            if hour < 8:
-                next_inform_time = datetime.combine(current_time.date(), time(8, 0, 0))
-            else:
-                day_to_friday = (11 - week_day) % 7
-                next_inform_time = datetime.combine(current_time.date() + timedelta(days=day_to_friday), time(8, 0, 0))
-        return next_inform_time
-
-    def get_next_feedback_time(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
-        week_day, hour = current_time.weekday(), current_time.hour
-        if week_day != 6:  # Not Sunday
-            day_to_sunday = 6 - week_day
-            next_feedback_time = datetime.combine(current_time.date() + timedelta(days=day_to_sunday), time(20, 0, 0))
-        else:
-            if hour < 20:
-                next_feedback_time = datetime.combine(current_time.date(), time(20, 0, 0))
-            else:
-                next_feedback_time = datetime.combine(current_time.date() + timedelta(days=7), time(20, 0, 0))
-        return next_feedback_time
 
     def schedule(self):
-        current_time = datetime.now(tz.gettz('Asia/Shanghai'))
+        current_time = datetime.now(util.TZ)
+        # 其他副本是主副本时不改动共享状态库中的提醒，成为主副本后由 take_over 恢复和规划
+        if self.is_leader():
+            self.restore_reminders()
+            self.plan_reminders()
         if self.test:
-            Bot.scheduler.add_job(self.raise_feedback, 'date', next_run_time=current_time)
-            Bot.scheduler.add_job(self.inform, 'date', next_run_time=current_time)
+            self.add_job(self.raise_feedback, 'date', next_run_time=current_time)
+            self.add_job(self.inform, 'date', next_run_time=current_time)
             # Bot.scheduler.add_job(self.raise_feedback, 'interval', minutes=5, next_run_time=current_time)
             # Bot.scheduler.add_job(self.inform, 'interval', minutes=5, next_run_time=current_time)
         else:
-            next_feed_back_time = self.get_next_feedback_time()
-            Bot.scheduler.add_job(self.raise_feedback, 'date', next_run_time=next_feed_back_time)
+            self.add_job(self.raise_feedback, weekly_trigger('sun', 20), id=f'raise_feedback:{self.config_path}',
+                         replace_existing=True, coalesce=True, misfire_grace_time=3600)
+            self.schedule_inform()
+        self.add_job(self.plan_reminders, daily_trigger(0, 5), id=f'plan_reminders:{self.config_path}',
+                     replace_existing=True, coalesce=True, misfire_grace_time=3600)
+
+
+# 一个组对应一个目录，目录中放该组的机器人配置文件，缺少的机器人不启动
+BOT_CONFIGS = [('course_reminder_bot_config.json', CourseReMinderBot), ('question_bot_config.json', QuestionBot)]
+
+
+def load_group(group_dir, test_flag, group=None):
+    bots = []
+    for file_name, bot_class in BOT_CONFIGS:
+        config_path = os.path.join(group_dir, file_name)
+        if os.path.exists(config_path):
+            bots.append(bot_class(config_path, test_flag, group=group))
+    return bots
+
 
-            next_inform_time = self.get_next_inform_time()
-            Bot.scheduler.add_job(self.inform, 'date', next_run_time=next_inform_time)
+def load_groups(groups_dir, test_flag):
+    bots = []
+    for name in sorted(os.listdir(groups_dir)):
+        if os.path.isdir(os.path.join(groups_dir, name)):
+            bots.extend(load_group(os.path.join(groups_dir, name), test_flag, group=name))
+    return bots
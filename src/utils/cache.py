@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CHUNK_SIZE = 1 << 16
+
+
+class CacheEntry:
+    __slots__ = ('key', 'etag', 'digest', 'size', 'fetched_at')
+
+    def __init__(self, key, etag, digest, size, fetched_at):
+        self.key = key
+        self.etag = etag
+        self.digest = digest
+        self.size = size
+        self.fetched_at = fetched_at
+
+
+# 下载中的内容直接写入临时文件，下载完成后再放入缓存目录
+class CacheWriter:
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        self.file = tempfile.NamedTemporaryFile(dir=cache.directory, suffix='.tmp', delete=False)
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.sha1.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self, etag=None):
+        self.file.close()
+        return self.cache._commit(self.url, self.file.name, etag, self.sha1.hexdigest(), self.size)
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.file.name)
+
+
+# 问题内容缓存，按链接索引，内存和磁盘分别按字节数做 LRU 淘汰
+# 问卷提交后内容不再变化，默认不过期；设置 max_age 后过期条目用 ETag 重新验证
+# 磁盘上的内容读取时校验 sha1，损坏的条目丢弃后重新下载
+class ContentCache:
+    def __init__(self, directory, memory_bytes=8 << 20, disk_bytes=64 << 20, max_age=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age = max_age
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.entries = OrderedDict()
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    # 按内容文件的修改时间恢复 LRU 顺序，清理上次运行留下的临时文件
+    def _load(self):
+        loaded = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.unlink(path)
+            elif name.endswith('.meta'):
+                try:
+                    with open(path, 'r') as f:
+                        meta = json.load(f)
+                    body_mtime = os.stat(self._path(meta['key'], '.body')).st_mtime
+                except (OSError, ValueError, KeyError):
+                    logging.warning(f'drop broken cache entry {path}')
+                    self._unlink(name[:-len('.meta')])
+                    continue
+                loaded.append((body_mtime, meta))
+        for _, meta in sorted(loaded, key=lambda x: x[0]):
+            self.entries[meta['url']] = CacheEntry(meta['key'], meta['etag'], meta['digest'], meta['size'],
+                                                   meta['fetched_at'])
+            self.disk_size += meta['size']
+
+    def _unlink(self, key):
+        for suffix in ('.body', '.meta'):
+            try:
+                os.unlink(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, url):
+        entry = self.entries.pop(url)
+        self.disk_size -= entry.size
+        if url in self.memory:
+            self.memory_size -= len(self.memory.pop(url))
+        self._unlink(entry.key)
+
+    def _shrink_memory(self):
+        while self.memory_size > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    # 至少保留最近使用的一个条目
+    def _shrink_disk(self):
+        while self.disk_size > self.disk_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+
+    def _remember(self, url, body):
+        if len(body) > self.memory_bytes // 8:
+            return
+        if url in self.memory:
+            self.memory_size -= len(self.memory.pop(url))
+        self.memory[url] = body
+        self.memory_size += len(body)
+        self._shrink_memory()
+
+    # 重新加载配置时调整容量和过期时间，超出新容量的条目立即淘汰，返回设置是否有变化
+    def configure(self, memory_bytes, disk_bytes, max_age):
+        with self.lock:
+            if (memory_bytes, disk_bytes, max_age) == (self.memory_bytes, self.disk_bytes, self.max_age):
+                return False
+            self.memory_bytes = memory_bytes
+            self.disk_bytes = disk_bytes
+            self.max_age = max_age
+            self._shrink_memory()
+            self._shrink_disk()
+            return True
+
+    def get(self, url, revalidated=False):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            if revalidated:
+                entry.fetched_at = time.time()
+                self._write_meta(url, entry)
+            elif self.max_age is not None and time.time() - entry.fetched_at > self.max_age:
+                return None
+            self.entries.move_to_end(url)
+            if url in self.memory:
+                self.memory.move_to_end(url)
+                return self.memory[url].decode('utf-8')
+            path = self._path(entry.key, '.body')
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                body = None
+            if body is None or hashlib.sha1(body).hexdigest() != entry.digest:
+                logging.warning(f'cache entry of {url} is broken, download again')
+                self._remove(url)
+                return None
+            os.utime(path)
+            self._remember(url, body)
+            return body.decode('utf-8')
+
+    # 条目过期时用于条件请求的头部
+    def validators(self, url):
+        entry = self.entries.get(url)
+        if entry is None or entry.etag is None:
+            return {}
+        return {'If-None-Match': entry.etag}
+
+    def writer(self, url):
+        return CacheWriter(self, url)
+
+    def _write_meta(self, url, entry):
+        with open(self._path(entry.key, '.meta'), 'w') as f:
+            json.dump({'url': url, 'key': entry.key, 'etag': entry.etag, 'digest': entry.digest, 'size': entry.size,
+                       'fetched_at': entry.fetched_at}, f)
+
+    def _commit(self, url, tmp_path, etag, digest, size):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        with self.lock:
+            if url in self.entries:
+                self._remove(url)
+            os.replace(tmp_path, self._path(key, '.body'))
+            entry = CacheEntry(key, etag, digest, size, time.time())
+            self._write_meta(url, entry)
+            self.entries[url] = entry
+            self.disk_size += size
+            self._shrink_disk()
+        return self.get(url)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# 同一个缓存目录在进程内只有一个实例，已有实例按最新的参数调整容量
+def get_content_cache(directory, memory_bytes=8 << 20, disk_bytes=64 << 20, max_age=None):
+    with _caches_lock:
+        key = os.path.abspath(directory)
+        if key not in _caches:
+            _caches[key] = ContentCache(directory, memory_bytes, disk_bytes, max_age)
+        elif _caches[key].configure(memory_bytes, disk_bytes, max_age):
+            logging.info(f'content cache {directory} reconfigured')
+        return _caches[key]
@@ -0,0 +1,138 @@
+import json
+import logging
+from datetime import datetime
+
+from src.utils.semester import parse_weekdays
+from src.utils.sender import DINGTALK_URL
+from src.utils.template import TEMPLATES, TemplateSet
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _date(value):
+    datetime.strptime(value, '%Y-%m-%d')
+
+
+def _time(value):
+    datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def _positive(value):
+    if value <= 0:
+        raise ValueError('must be positive')
+
+
+def _language(value):
+    if value not in TEMPLATES:
+        raise ValueError(f'must be one of {", ".join(TEMPLATES)}')
+
+
+# 模板在加载配置时编译一次，模板名或字段有误时直接报错
+def _templates(value):
+    if not all(isinstance(source, str) for source in value.values()):
+        raise ValueError('templates must be strings')
+    TemplateSet(overrides=value)
+
+
+def _weekdays(value):
+    parse_weekdays(value)
+
+
+def _url(value):
+    if not value.startswith(('http://', 'https://')):
+        raise ValueError('must be an http(s) url')
+
+
+# required 为 True 时必须配置，为 'test' / 'prod' 时只在测试 / 正式运行时必须配置
+class Field:
+    __slots__ = ('name', 'types', 'required', 'default', 'check')
+
+    def __init__(self, name, types, required=False, default=None, check=None):
+        self.name = name
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.default = default
+        self.check = check
+
+
+# 配置项在导入时整理成字段表，每次加载只需一次遍历检查类型并补全默认值
+class Schema:
+    def __init__(self, *fields, base=None):
+        self.fields = (base.fields if base is not None else ()) + fields
+        self.names = frozenset(field.name for field in self.fields)
+        self.defaults = {field.name: field.default for field in self.fields}
+
+    def validate(self, config, test):
+        if not isinstance(config, dict):
+            raise ConfigError('config must be a JSON object')
+        unknown = config.keys() - self.names
+        if len(unknown) > 0:
+            logging.warning(f'unknown config keys: {", ".join(sorted(unknown))}')
+        result = dict(self.defaults)
+        result.update(config)
+        for field in self.fields:
+            value = result.get(field.name)
+            if value is None:
+                if field.required is True or field.required == ('test' if test else 'prod'):
+                    raise ConfigError(f'{field.name} is required')
+                continue
+            # bool 是 int 的子类，不能当作数字
+            if not isinstance(value, field.types) or (isinstance(value, bool) and bool not in field.types):
+                raise ConfigError(f'{field.name} must be {" or ".join(t.__name__ for t in field.types)}')
+            if field.check is not None:
+                try:
+                    field.check(value)
+                except ValueError as e:
+                    raise ConfigError(f'{field.name}: {e}')
+        return result
+
+
+BOT_SCHEMA = Schema(
+    Field('access_token', str, required='prod'),
+    Field('secret', str, required='prod'),
+    Field('test_access_token', str, required='test'),
+    Field('test_secret', str, required='test'),
+    Field('webhook_url', str, default=DINGTALK_URL, check=_url),
+    Field('rate_limit', int, default=20, check=_positive),
+    Field('merge_markdown', bool, default=False),
+    Field('state_path', str, default='log/state.db'),
+    Field('language', str, default='zh', check=_language),
+    Field('templates', dict, check=_templates),
+)
+
+QUESTION_BOT_SCHEMA = Schema(
+    Field('questionnaire_url', str, required=True, check=_url),
+    Field('last_question_timestamp', str, check=_time),
+    Field('download_workers', int, default=8, check=_positive),
+    Field('download_timeout', (int, float), default=10, check=_positive),
+    Field('question_claim_timeout', (int, float), default=3600, check=_positive),
+    Field('question_max_attempts', int, default=5, check=_positive),
+    Field('question_cache_dir', str, default='log/question_cache'),
+    Field('question_cache_memory_mb', int, default=8, check=_positive),
+    Field('question_cache_disk_mb', int, default=64, check=_positive),
+    Field('question_cache_max_age', (int, float), check=_positive),
+    base=BOT_SCHEMA,
+)
+
+COURSE_REMINDER_BOT_SCHEMA = Schema(
+    Field('first_single_day', str, required=True, check=_date),
+    Field('corpus_path', str, required=True),
+    Field('curricula_path', str, required=True),
+    Field('shifts_path', str, required=True),
+    Field('semester_weeks', int, default=20, check=_positive),
+    Field('inform_days', str, default='fri-sun', check=_weekdays),
+    Field('lookahead_days', int, default=7, check=_positive),
+    Field('reminder_grace_minutes', (int, float), default=15),
+    base=BOT_SCHEMA,
+)
+
+
+def load(path, schema, test):
+    with open(path, 'r') as f:
+        try:
+            config = json.load(f)
+        except ValueError as e:
+            raise ConfigError(f'invalid JSON: {e}')
+    return schema.validate(config, test)
@@ -0,0 +1,143 @@
+from bisect import bisect_left
+
+from src.utils.timetable import WEEKDAYS
+
+
+# 按资源（教室、老师、学生）分组的时间区间，每组按开始时间排序
+# 同时记录前缀最大结束时间，查询重叠区间只需二分定位后向前扫描真正重叠的几项
+class IntervalIndex:
+    def __init__(self):
+        self.groups = {}
+        self.starts = {}
+        self.max_ends = {}
+
+    def add(self, key, start, end, item):
+        self.groups.setdefault(key, []).append((start, end, item))
+
+    def build(self):
+        for key, intervals in self.groups.items():
+            intervals.sort(key=lambda x: (x[0], x[1]))
+            self.starts[key] = [start for start, _, _ in intervals]
+            max_ends, max_end = [], None
+            for _, end, _ in intervals:
+                max_end = end if max_end is None or end > max_end else max_end
+                max_ends.append(max_end)
+            self.max_ends[key] = max_ends
+        return self
+
+    def overlapping(self, key, start, end):
+        intervals = self.groups.get(key)
+        if intervals is None:
+            return []
+        starts, max_ends = self.starts[key], self.max_ends[key]
+        result = []
+        k = bisect_left(starts, end) - 1
+        while k >= 0 and max_ends[k] > start:
+            if intervals[k][1] > start:
+                result.append(intervals[k][2])
+            k -= 1
+        return result
+
+    # 同一资源内两两重叠的区间，排序后一次扫描
+    def conflicts(self):
+        for key, intervals in self.groups.items():
+            active = []
+            for start, end, item in intervals:
+                active = [(e, other) for e, other in active if e > start]
+                for _, other in active:
+                    yield key, other, item
+                active.append((end, item))
+
+
+def resources(teacher, place, students):
+    keys = [('room', place), ('teacher', teacher)]
+    keys.extend(('student', student) for student in students)
+    return [(kind, value) for kind, value in keys if value != '']
+
+
+def describe(i):
+    return f'{i.name}（{i.teacher}）[{i.place}, {i.start.strftime("%H:%M")}-{i.end.strftime("%H:%M")}]'
+
+
+# 同一对课程可能在教室、老师和多名学生上同时冲突，合并成一条
+def describe_resources(keys):
+    students = [value for kind, value in keys if kind == 'student']
+    parts = [f'{kind} {value}' for kind, value in keys if kind != 'student']
+    if len(students) > 0:
+        parts.append(f'student {students[0]}' if len(students) == 1 else f'{len(students)} students')
+    return ', '.join(parts)
+
+
+def weekly_index(curricula):
+    index = IntervalIndex()
+    for i in curricula:
+        for resource in resources(i.teacher, i.place, i.students):
+            index.add(resource + (i.weekday, i.is_single), i.start, i.end, i)
+    return index.build()
+
+
+# 检查课表中同一教室、老师或学生在同一时间的重复安排，以及调课的原课程是否存在、调到的时间是否已被占用
+# 课表按 (资源, 星期, 单双周) 建立区间索引，每条调课只需几次二分查询
+def find_conflicts(calendar):
+    store = calendar.store
+    store._index()
+    problems = []
+    parity = {}
+    descriptions = {}
+
+    def single_week(cur_date):
+        if cur_date not in parity:
+            parity[cur_date] = calendar.is_single(cur_date)
+        return parity[cur_date]
+
+    def describe_class(i):
+        if id(i) not in descriptions:
+            descriptions[id(i)] = describe(i)
+        return descriptions[id(i)]
+
+    weekly = weekly_index(store.curricula)
+    pairs = {}
+    for (kind, name, weekday, is_single), first, second in weekly.conflicts():
+        pairs.setdefault((id(first), id(second)), (weekday, is_single, first, second, []))[4].append((kind, name))
+    for weekday, is_single, first, second, keys in pairs.values():
+        problems.append(f'{describe_class(first)} and {describe_class(second)} overlap on {WEEKDAYS[weekday]} '
+                        f'({"single" if is_single else "double"} weeks): {describe_resources(keys)}')
+
+    # 找出每条调课的原课程，调到同一天的调课之间也可能冲突
+    moved = []
+    targets = IntervalIndex()
+    for shift in store.shifts:
+        source, target = shift.source, shift.target
+        classes = [i for i in store.by_course.get((source.course, source.date.weekday(), source.start, source.place), [])
+                   if i.is_single == single_week(source.date)]
+        if len(classes) == 0:
+            problems.append(f'shift of {source.course} on {source.date.strftime("%Y-%m-%d")} '
+                            f'{source.start.strftime("%H:%M")} at {source.place}: no such class')
+            continue
+        for i in classes:
+            for resource in resources(i.teacher, target.place, i.students):
+                targets.add(resource + (target.date,), target.start, target.end, len(moved))
+            moved.append((shift, i))
+    targets.build()
+
+    for k, (shift, i) in enumerate(moved):
+        target = shift.target
+        # 当天已调走的课程不再占用原时间
+        moved_away = {(s.source.course, s.source.start, s.source.place) for s in store.shifts_from.get(target.date, [])}
+        busy = {}
+        slot = (target.date.weekday(), single_week(target.date))
+        for resource in resources(i.teacher, target.place, i.students):
+            for other in weekly.overlapping(resource + slot, target.start, target.end):
+                if (other.name, other.start, other.place) in moved_away:
+                    continue
+                busy.setdefault(id(other), (other, []))[1].append(resource)
+            # 每对调课只报告一次
+            for other_k in targets.overlapping(resource + (target.date,), target.start, target.end):
+                if other_k > k:
+                    busy.setdefault(('shift', other_k), (moved[other_k][1], []))[1].append(resource)
+        for key, (other, keys) in busy.items():
+            problems.append(f'shift of {describe_class(i)} to {target.date.strftime("%Y-%m-%d")} '
+                            f'{target.start.strftime("%H:%M")}-{target.end.strftime("%H:%M")} at {target.place} '
+                            f'clashes with {"the shift of " if isinstance(key, tuple) else ""}{describe_class(other)}: '
+                            f'{describe_resources(keys)}')
+    return problems
@@ -1,63 +1,75 @@
+import sys
 from datetime import datetime, date, time, timedelta
 
-from dateutil import tz
+from src.utils.util import TZ
 
 
 # 某一门课程
 class Curriculum:
+    __slots__ = ('is_single', 'weekday', 'start', 'end', 'place', 'name', 'teacher', 'students')
+
     def __init__(self, is_single, weekday, start, end, place, name, teacher, students):
         self.is_single = is_single
         self.weekday = weekday
         self.start = start
         self.end = end
-        self.place = place
-        self.name = name
-        self.teacher = teacher
-        self.students = students
+        # 地点、教师、学生在整个学期的课程里大量重复，驻留后共用同一个字符串对象
+        self.place = sys.intern(place)
+        self.name = sys.intern(name)
+        self.teacher = sys.intern(teacher)
+        self.students = tuple(sys.intern(i) for i in students)
 
     def get_class(self, cur_date):
         return Class(cur_date, self.is_single, self.weekday, self.start, self.end, self.place, self.name, self.teacher,
                      self.students)
 
 
-# 具体某一天的某一节课
+# 具体某一天的某一节课，创建后不再修改，调课通过 moved 生成新的对象
 class Class(Curriculum):
-    def __init__(self, cur_date, is_single, weekday, start, end, place, name, teacher, students):
+    __slots__ = ('date', 'shifted', '_key', '_hash')
+
+    def __init__(self, cur_date, is_single, weekday, start, end, place, name, teacher, students, shifted=False):
         super().__init__(is_single, weekday, start, end, place, name, teacher, students)
         self.date = cur_date
-        self.shifted = False
+        self.shifted = shifted
+        self._key = (cur_date, start, end, self.place, is_single, self.name, self.teacher)
+        self._hash = hash(self._key)
+
+    def moved(self, cur_date, start, end, place):
+        return Class(cur_date, self.is_single, self.weekday, start, end, place, self.name, self.teacher,
+                     self.students, shifted=True)
 
     def __lt__(self, other):
-        return self.date < other.date or (self.date == other.date and self.start < other.start)
+        return self._key < other._key
 
     def __eq__(self, other):
-        return self.date == other.date and self.start == other.start and self.end == other.end and self.place == other.place
+        return self._key == other._key
 
     def __hash__(self):
-        return (self.date.strftime('%Y-%m-%d') + self.start.strftime('%H:%M') + self.place + str(
-            self.is_single) + self.name + self.teacher).__hash__()
+        return self._hash
 
 
 class ShiftInfo:
+    __slots__ = ('course', 'date', 'start', 'end', 'place')
+
     def __init__(self, course, date_info, start, end, place):
 
-        self.course = course
-        self.date = datetime.strptime(date_info, "%Y-%m-%d").replace(
-            tzinfo=tz.gettz('Asia/Shanghai')).date()
-        self.start = datetime.strptime(start, "%H:%M").replace(
-            tzinfo=tz.gettz('Asia/Shanghai')).time()
-        self.end = datetime.strptime(end, "%H:%M").replace(
-            tzinfo=tz.gettz('Asia/Shanghai')).time()
-        self.place = place
+        self.course = sys.intern(course)
+        self.date = datetime.strptime(date_info, "%Y-%m-%d").replace(tzinfo=TZ).date()
+        self.start = datetime.strptime(start, "%H:%M").replace(tzinfo=TZ).time()
+        self.end = datetime.strptime(end, "%H:%M").replace(tzinfo=TZ).time()
+        self.place = sys.intern(place)
 
 
 class Shift:
+    __slots__ = ('source', 'target')
+
     def __init__(self, source, target):
         self.source = source
         self.target = target
 
 
 def cal_single(ref_date, cur_single, target_date):
-    days = (target_date - ref_date).days
-    days = days % 14
-    return cur_single if ref_date.weekday() + days < 7 else not cur_single
+    # 从参考日期所在周的周一开始计算，参考日期不是周一时也能正确处理跨周
+    days = (target_date - ref_date).days + ref_date.weekday()
+    return cur_single if days % 14 < 7 else not cur_single
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+from src.utils import aio, util
+
+
+def _failed(item, e):
+    logging.warning(f'download failed: {item.get("href")} ({e})')
+
+
+# 下载题目等 I/O 密集任务的线程池，进程内复用，连接来自共享连接池
+class FetchPool:
+    def __init__(self, max_workers=8, timeout=10):
+        self.max_workers = max_workers
+        self.timeout = urllib3.Timeout(connect=timeout, read=timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+
+    def _download(self, item, cache=None):
+        try:
+            return util.download(item, timeout=self.timeout, cache=cache)
+        except Exception as e:
+            _failed(item, e)
+            return None
+
+    # 返回与 items 一一对应的结果，下载失败的位置为 None
+    def download_all(self, items, cache=None):
+        return list(self.executor.map(lambda item: self._download(item, cache), items))
+
+    async def download_all_async(self, items, cache=None):
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def download(item):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(aio.download(item, cache), self.timeout.read_timeout)
+                except Exception as e:
+                    _failed(item, e)
+                    return None
+
+        return await asyncio.gather(*[download(item) for item in items])
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# 参数相同的机器人共用一个下载线程池
+def get_fetch_pool(max_workers=8, timeout=10):
+    with _pools_lock:
+        if (max_workers, timeout) not in _pools:
+            _pools[(max_workers, timeout)] = FetchPool(max_workers, timeout)
+        return _pools[(max_workers, timeout)]
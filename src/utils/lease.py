@@ -0,0 +1,89 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+# 多个副本通过状态库中的租约选出每个组的主副本，只有主副本执行该组的任务
+# 主副本每 ttl/3 秒续约一次；崩溃后租约在 ttl 秒内过期，由其他副本接管
+# 判断是否为主副本只看本地记录的到期时间，并预留 margin 秒，避免与接管的副本同时执行
+class LeaseManager:
+    def __init__(self, ttl=15, max_leases=None, margin=2):
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.ttl = ttl
+        self.max_leases = max_leases
+        self.margin = margin
+        self.leases = {}
+        self.held = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # 同一组的机器人共用一个租约；租约存放在各自的状态库中，通常是同一个
+    def register(self, name, state, on_acquire=None):
+        with self.lock:
+            entries = self.leases.setdefault(name, {})
+            callbacks = entries.setdefault(state.path, (state, []))[1]
+            if on_acquire is not None:
+                callbacks.append(on_acquire)
+
+    def is_leader(self, name):
+        return self.held.get(name, 0) - self.margin > time.time()
+
+    def _acquire(self, name, entries):
+        acquired = []
+        for state, _ in entries.values():
+            if not state.acquire_lease(name, self.holder, self.ttl):
+                for other in acquired:
+                    other.release_lease(name, self.holder)
+                return False
+            acquired.append(state)
+        return True
+
+    def renew(self):
+        with self.lock:
+            leases = list(self.leases.items())
+        for name, entries in leases:
+            was_leader = name in self.held
+            if not was_leader and self.max_leases is not None and len(self.held) >= self.max_leases:
+                continue
+            start = time.time()
+            try:
+                ok = self._acquire(name, entries)
+            except Exception:
+                logging.exception(f'renew lease {name} failed')
+                ok = False
+            if ok:
+                self.held[name] = start + self.ttl
+                if not was_leader:
+                    logging.info(f'{self.holder} is now the leader of {name}')
+                    for _, callbacks in entries.values():
+                        for callback in callbacks:
+                            callback()
+            elif was_leader and self.held[name] < time.time():
+                del self.held[name]
+                logging.warning(f'{self.holder} lost the lease of {name}')
+            elif not was_leader:
+                logging.debug(f'{name} is led by another replica')
+
+    def _run(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            self.renew()
+
+    # 启动前先同步续约一次，主副本确定后再启动调度器
+    def start(self):
+        if self.thread is not None:
+            return
+        self.renew()
+        self.thread = threading.Thread(target=self._run, name='lease', daemon=True)
+        self.thread.start()
+
+    def release_all(self):
+        with self.lock:
+            leases = list(self.leases.items())
+        for name, entries in leases:
+            if self.held.pop(name, None) is not None:
+                for state, _ in entries.values():
+                    state.release_lease(name, self.holder)
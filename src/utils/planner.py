@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from src.utils import util
+
+REMINDER_LEAD = timedelta(minutes=15)
+
+
+# 一次规划未来若干天的课程提醒
+# 课表文件变化时重新规划整个窗口，只有调课文件变化时只重新规划调课涉及的日期，都没有变化时只补充新进入窗口的日期
+class ReminderPlanner:
+    def __init__(self, owner, calendar, templates, lookahead_days=7):
+        self.owner = owner
+        self.calendar = calendar
+        self.templates = templates
+        self.lookahead = timedelta(days=lookahead_days)
+        self.version = None
+        self.shift_dates = {}
+        self.until = None
+
+    # 同一时间同一教室可能有多门课（合并的多校区课表中教室名会重复），课程名和老师也要作为 id 的一部分
+    def reminder_id(self, i):
+        return f'reminder:{self.owner}:{i.date.strftime("%Y-%m-%d")}:{i.start.strftime("%H:%M")}:{i.place}:' \
+               f'{i.name}:{i.teacher}'
+
+    def _dates(self, today, end):
+        store = self.calendar.store
+        version = store.version
+        first_new = today if self.until is None else max(self.until, today)
+        dates = {first_new + timedelta(days=k) for k in range((end - first_new).days)}
+        if version == self.version:
+            return dates
+
+        shift_dates = store.shifts_by_date()
+        if self.version is None or version[0] != self.version[0]:
+            dates = {today + timedelta(days=k) for k in range((end - today).days)}
+        else:
+            dates |= {cur_date for cur_date in shift_dates.keys() | self.shift_dates.keys()
+                      if today <= cur_date < end and shift_dates.get(cur_date) != self.shift_dates.get(cur_date)}
+        self.version, self.shift_dates = version, shift_dates
+        return dates
+
+    # pending 为状态库中尚未发送的提醒 {id: (run_time, content)}
+    # 返回需要新增或改动的提醒和需要取消的提醒 id，与已有提醒相同的不再返回
+    def plan(self, now, pending):
+        today = now.date()
+        end = today + self.lookahead
+        dates = self._dates(today, end)
+
+        planned = {}
+        for cur_date in sorted(dates):
+            for i in self.calendar.classes_on(cur_date):
+                run_time = datetime.combine(i.date, i.start, tzinfo=util.TZ) - REMINDER_LEAD
+                if run_time > now:
+                    content = {'content': self.templates.render_class('reminder', i)}
+                    planned[self.reminder_id(i)] = (run_time, content)
+
+        # 已过时间的提醒不会出现在 planned 中，由 restore_reminders 在宽限期内补发，不能取消
+        cancelled = [reminder_id for reminder_id, (run_time, _) in pending.items()
+                     if reminder_id not in planned and run_time > now.timestamp()
+                     and (datetime.fromtimestamp(run_time, util.TZ) + REMINDER_LEAD).date() in dates]
+        changed = {reminder_id: (run_time, content) for reminder_id, (run_time, content) in planned.items()
+                   if pending.get(reminder_id) != (run_time.timestamp(), content)}
+
+        self.until = end
+        return changed, cancelled
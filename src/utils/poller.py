@@ -0,0 +1,108 @@
+import logging
+
+from src.utils import aio, util
+
+PARSER = None
+TABLE_STRAINER = None
+
+
+# bs4 和 lxml 导入较慢，第一次解析页面时才导入
+def _load_parser():
+    global PARSER, TABLE_STRAINER
+    if TABLE_STRAINER is None:
+        from bs4 import SoupStrainer
+        try:
+            import lxml  # noqa: F401
+            PARSER = 'lxml'
+        except ImportError:
+            PARSER = 'html.parser'
+        # 只解析提问列表所在的表格，跳过页面其余部分
+        TABLE_STRAINER = SoupStrainer(attrs={'class': 'table-content'})
+
+
+def parse_row(row):
+    href = ''
+    upload_time = None
+    for column in row.find_all('td'):
+        result = column.find('a')
+        if result is not None:
+            href = result.attrs['href']
+        else:
+            result = column.find('div')
+            if result is not None:
+                upload_time = util.parse_time(result.attrs['title'])
+    return href, upload_time
+
+
+class QuestionnairePoller:
+    def __init__(self, url, etag=None, last_modified=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.pending = None
+
+    def headers(self):
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def _received(self, status, headers):
+        if status == 304:
+            logging.info('questionnaire not modified')
+            return False
+        if status != 200:
+            raise RuntimeError(f'questionnaire request failed: {status}')
+        self.pending = (headers.get('ETag'), headers.get('Last-Modified'))
+        return True
+
+    # 返回页面内容，页面未修改时返回 None
+    def fetch(self):
+        r = util.http.request('GET', self.url, headers=self.headers(), timeout=util.REQUEST_TIMEOUT)
+        if not self._received(r.status, r.headers):
+            return None
+        return r.data.decode(encoding='UTF-8')
+
+    async def fetch_async(self):
+        async with aio.session().get(self.url, headers=self.headers()) as r:
+            if not self._received(r.status, r.headers):
+                return None
+            return await r.text(encoding='UTF-8')
+
+    # 新问题全部处理完后再记录校验信息，否则失败后会因 304 漏掉问题
+    def commit(self):
+        if self.pending is not None:
+            self.etag, self.last_modified = self.pending
+            self.pending = None
+
+    # 提交时间与 last_time 相同的行也会返回，由 seen 中已推送的链接去重
+    def parse(self, page, last_time, seen=()):
+        from bs4 import BeautifulSoup
+        _load_parser()
+        soup = BeautifulSoup(page, features=PARSER, parse_only=TABLE_STRAINER)
+        table = soup.find(attrs={'class': 'table-content'}).find_all('tr')[1:]
+        if len(table) == 0:
+            return []
+
+        # 按时间从新到旧扫描，遇到早于 last_time 的行即可停止
+        first, last = parse_row(table[0])[1], parse_row(table[-1])[1]
+        ascending = first is not None and last is not None and first < last
+        rows = reversed(table) if ascending else table
+        data = []
+        for row in rows:
+            href, upload_time = parse_row(row)
+            if upload_time is None:
+                continue
+            if last_time is not None and upload_time < last_time:
+                break
+            if href in seen:
+                continue
+            data.append({
+                'href': href,
+                'time': upload_time
+            })
+        # 按提交时间先后推送
+        data.reverse()
+        return data
@@ -0,0 +1,126 @@
+from datetime import datetime, time, timedelta
+
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.cron import CronTrigger
+
+from src.utils.curriculum import cal_single
+from src.utils.util import TZ
+
+WEEKDAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def _weekday(name):
+    name = name.strip().lower()
+    if name in WEEKDAY_NAMES:
+        return WEEKDAY_NAMES.index(name)
+    if name.isdigit() and int(name) < 7:
+        return int(name)
+    raise ValueError(f'unknown weekday {name}')
+
+
+# 解析 cron 格式的星期，如 fri-sun、sat,sun、*，周一为 0
+def parse_weekdays(expr):
+    weekdays = set()
+    for part in expr.split(','):
+        if part.strip() == '*':
+            weekdays.update(range(7))
+            continue
+        first, _, last = part.partition('-')
+        first = _weekday(first)
+        last = _weekday(last) if last != '' else first
+        if last < first:
+            raise ValueError(f'invalid weekday range {part}')
+        weekdays.update(range(first, last + 1))
+    return frozenset(weekdays)
+
+
+# 学期中的某一天，shifts_in 为调入当天的调课
+class Day:
+    __slots__ = ('date', 'is_single', 'shifts_in')
+
+    def __init__(self, cur_date, is_single, shifts_in):
+        self.date = cur_date
+        self.is_single = is_single
+        self.shifts_in = shifts_in
+
+
+# 预先算好整个学期每一天的单双周和调入的课程，课表或调课文件修改后重新计算
+# 早安消息在 inform_days 中的日子发送，另外有课程调入的日子也发送，不会漏掉调到其他日子的课
+class SemesterCalendar:
+    def __init__(self, first_single_day, store, weeks=20, inform_days='fri-sun'):
+        self.first_single_day = first_single_day
+        self.store = store
+        self.start = first_single_day - timedelta(days=first_single_day.weekday())
+        self.end = self.start + timedelta(weeks=weeks)
+        self.inform_weekdays = parse_weekdays(inform_days)
+        self.days = {}
+        self.version = None
+
+    def _build(self):
+        version = self.store.version
+        if version == self.version:
+            return
+        self.store._index()
+        days = {}
+        cur_date = self.start
+        while cur_date < self.end:
+            is_single = (cur_date - self.start).days // 7 % 2 == 0
+            days[cur_date] = Day(cur_date, is_single, self.store.shifts_to.get(cur_date, []))
+            cur_date += timedelta(days=1)
+        self.days = days
+        self.version = version
+
+    def day(self, cur_date):
+        self._build()
+        day = self.days.get(cur_date)
+        if day is None:
+            # 学期范围之外按单双周规律推算
+            return Day(cur_date, cal_single(self.first_single_day, True, cur_date),
+                       self.store.shifts_to.get(cur_date, []))
+        return day
+
+    def is_single(self, cur_date):
+        return self.day(cur_date).is_single
+
+    def is_inform_day(self, cur_date):
+        return cur_date.weekday() in self.inform_weekdays or len(self.day(cur_date).shifts_in) > 0
+
+    def classes_on(self, cur_date):
+        return self.store.classes_on(cur_date, self.is_single(cur_date))
+
+
+# 按学期日历计算下一次发送早安消息的时间，调课文件修改后需要重新添加任务
+class CalendarTrigger(BaseTrigger):
+    def __init__(self, calendar, hour, minute=0):
+        self.calendar = calendar
+        self.time = time(hour, minute)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        cur_date = now.astimezone(TZ).date()
+        # inform_days 至少包含一天，一周之内一定能找到
+        for _ in range(8):
+            if self.calendar.is_inform_day(cur_date):
+                fire_time = datetime.combine(cur_date, self.time, tzinfo=TZ)
+                if fire_time >= now and (previous_fire_time is None or fire_time > previous_fire_time):
+                    return fire_time
+            cur_date += timedelta(days=1)
+        return None
+
+    def __str__(self):
+        return f'calendar[{self.time.strftime("%H:%M")}]'
+
+
+# 各机器人的固定任务时间，每个任务只注册一次，由触发器计算下一次执行时间
+def weekly_trigger(day_of_week, hour, minute=0):
+    return CronTrigger(day_of_week=day_of_week, hour=hour, minute=minute, timezone='Asia/Shanghai')
+
+
+def daily_trigger(hour, minute=0):
+    return CronTrigger(hour=hour, minute=minute, timezone='Asia/Shanghai')
+
+
+def check_trigger():
+    # 16:00 - 21:50 每 10 分钟一次，另加 22:00 最后一次
+    return OrTrigger([CronTrigger(hour='16-21', minute='*/10', timezone='Asia/Shanghai'),
+                      CronTrigger(hour=22, minute=0, timezone='Asia/Shanghai')])
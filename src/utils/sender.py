@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from src.utils import aio, metrics, util
+
+DINGTALK_URL = 'https://oapi.dingtalk.com/robot/send'
+# 130101: 发送速度太快而限流; 130102: 发送消息被限流
+THROTTLE_ERRCODES = {'130101', '130102'}
+# 钉钉 markdown 消息体上限约 20000 字节，合并时留出余量
+MAX_MERGED_LENGTH = 15000
+
+
+def _observe(start, result):
+    outcome = 'error' if isinstance(result, Exception) else str(result.get('errcode'))
+    metrics.observe('send_latency_seconds', time.perf_counter() - start, outcome=outcome)
+
+
+# 滑动窗口限流：任意 per 秒内最多发送 rate 条，与钉钉的限流规则一致
+# 窗口未满时可以连续发送，窗口满后等到最早一条移出窗口
+class SlidingWindow:
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.sent = deque()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    # 占用一个发送名额，返回 0；窗口已满时返回需要等待的秒数
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            while len(self.sent) > 0 and self.sent[0] <= now - self.per:
+                self.sent.popleft()
+            if len(self.sent) < self.rate:
+                self.sent.append(now)
+                return 0
+            return self.sent[0] + self.per - now
+
+    # 调整限流设置，已发送的记录保留，调整前后合计仍不超过新的限制
+    def update(self, rate, per):
+        with self.lock:
+            self.rate = rate
+            self.per = per
+
+    def acquire(self):
+        while (wait := self.reserve()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+
+    def drain(self):
+        # 服务端已经限流，本地记录不可信，等待一个完整窗口后再发送
+        with self.lock:
+            self.blocked_until = time.monotonic() + self.per
+
+
+class Sender:
+    def __init__(self, access_token, secret, **kwargs):
+        self.access_token = access_token
+        self.settings = None
+        self.limiter = None
+        self.pending = None
+        self.configure(secret, **kwargs)
+        self._start()
+
+    # 地址、签名、限流等设置，重新加载配置时原地更新，队列中尚未发送的消息按新设置发送
+    # 返回设置是否有变化
+    def configure(self, secret, url=DINGTALK_URL, rate=20, per=60, merge_markdown=False, max_retries=5, backoff=3):
+        settings = (secret, url, rate, per, merge_markdown, max_retries, backoff)
+        if settings == self.settings:
+            return False
+        if self.settings is None or self.settings[0] != secret:
+            self.signer = util.Signer(secret)
+        if self.limiter is None:
+            self.limiter = SlidingWindow(rate, per)
+        else:
+            self.limiter.update(rate, per)
+        self.url = url
+        self.merge_markdown = merge_markdown
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.settings = settings
+        return True
+
+    def _start(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f'sender-{self.access_token[:8]}', daemon=True)
+        self.thread.start()
+
+    # callback(ok) 在消息最终推送成功或放弃后调用
+    def send(self, msg_type, content, at=None, callback=None):
+        self.queue.put_nowait(({
+            "msgtype": msg_type,
+            msg_type: content,
+            "at": at if at is not None else {}
+        }, callback))
+
+    def flush(self):
+        self.queue.join()
+
+    def _next(self):
+        if self.pending is not None:
+            item, self.pending = self.pending, None
+            return item
+        return self.queue.get()
+
+    def _merge(self, payload, callbacks):
+        # 合并队列中相邻的 markdown 消息，at 信息不同的不合并
+        while self.pending is None:
+            try:
+                item, callback = self.queue.get_nowait()
+            except (queue.Empty, asyncio.QueueEmpty):
+                break
+            text = payload['markdown']['text']
+            if item['msgtype'] != 'markdown' or item['at'] != payload['at'] or \
+                    len(text) + len(item['markdown']['text']) > MAX_MERGED_LENGTH:
+                self.pending = (item, callback)
+                break
+            payload['markdown'] = {
+                'title': payload['markdown']['title'],
+                'text': text + '\n\n---\n\n' + item['markdown']['text']
+            }
+            callbacks.append(callback)
+
+    def _done(self, callbacks, ok):
+        metrics.inc('send_total', outcome='ok' if ok else 'failed')
+        for callback in callbacks:
+            if callback is not None:
+                try:
+                    callback(ok)
+                except Exception:
+                    logging.exception('推送回调异常')
+            self.queue.task_done()
+
+    def _run(self):
+        while True:
+            payload, callback = self._next()
+            callbacks = [callback]
+            if self.merge_markdown and payload['msgtype'] == 'markdown':
+                self._merge(payload, callbacks)
+            ok = False
+            try:
+                ok = self._deliver(payload)
+            except Exception:
+                logging.exception('推送线程异常')
+            finally:
+                self._done(callbacks, ok)
+
+    def _url(self):
+        timestamp = str(round(time.time() * 1000))
+        sign = self.signer.sign(timestamp)
+        return f"{self.url}?access_token={self.access_token}&timestamp={timestamp}&sign={sign}"
+
+    def _post(self, payload):
+        r = util.http.request('POST', self._url(),
+                              headers={
+                                  "Content-Type": "application/json",
+                              },
+                              body=json.dumps(payload),
+                              timeout=util.REQUEST_TIMEOUT)
+        return json.loads(r.data)
+
+    # 返回 True 表示推送成功，False 表示不可重试的失败，None 表示需要退避重试
+    def _check(self, payload, result, attempt):
+        content = payload[payload['msgtype']]
+        if isinstance(result, Exception):
+            logging.warning(f'推送请求失败({attempt + 1}/{self.max_retries + 1}): {result}')
+        else:
+            errcode = str(result.get('errcode'))
+            if errcode == '0':
+                logging.info(f'Snapshot:\n{str(content)[0:50]}...\n推送成功!')
+                return True
+            if errcode in THROTTLE_ERRCODES:
+                logging.warning(f'推送被限流({attempt + 1}/{self.max_retries + 1}): {result}')
+                self.limiter.drain()
+            else:
+                attempt = self.max_retries
+        if attempt >= self.max_retries:
+            logging.error(f'Snapshot:\n{str(content)[0:50]}...\n推送失败!')
+            logging.error(result)
+            return False
+        return None
+
+    def _deliver(self, payload):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = self._post(payload)
+            except Exception as e:
+                result = e
+            _observe(start, result)
+            done = self._check(payload, result, attempt)
+            if done is not None:
+                return done
+            time.sleep(self.backoff * 2 ** attempt)
+
+
+class AsyncSender(Sender):
+    def _start(self):
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def send(self, msg_type, content, at=None, callback=None):
+        # 在事件循环中第一次发送时启动推送协程
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        super(AsyncSender, self).send(msg_type, content, at, callback)
+
+    async def flush(self):
+        await self.queue.join()
+
+    async def _next(self):
+        if self.pending is not None:
+            item, self.pending = self.pending, None
+            return item
+        return await self.queue.get()
+
+    async def _run(self):
+        while True:
+            payload, callback = await self._next()
+            callbacks = [callback]
+            if self.merge_markdown and payload['msgtype'] == 'markdown':
+                self._merge(payload, callbacks)
+            ok = False
+            try:
+                ok = await self._deliver(payload)
+            except Exception:
+                logging.exception('推送协程异常')
+            finally:
+                self._done(callbacks, ok)
+
+    async def _deliver(self, payload):
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire_async()
+            start = time.perf_counter()
+            try:
+                result = await aio.post_json(self._url(), payload)
+            except Exception as e:
+                result = e
+            _observe(start, result)
+            done = self._check(payload, result, attempt)
+            if done is not None:
+                return done
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+# 同一个机器人共用一个发送队列，保证限流按机器人计算
+# 已有的发送队列按最新的参数更新设置，重新加载配置后立即生效
+def get_sender(access_token, secret, engine='blocking', **kwargs):
+    with _senders_lock:
+        if access_token not in _senders:
+            sender_class = AsyncSender if engine == 'asyncio' else Sender
+            _senders[access_token] = sender_class(access_token, secret, **kwargs)
+        elif _senders[access_token].configure(secret, **kwargs):
+            logging.info(f'sender {access_token[:8]} reconfigured')
+        return _senders[access_token]
+
+
+def flush_all():
+    for sender in list(_senders.values()):
+        if not isinstance(sender, AsyncSender):
+            sender.flush()
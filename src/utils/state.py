@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# 持久化的运行状态：待发送的课程提醒、提问检查水位、已推送的问题、推送记录和副本之间的租约
+# 所有写操作都在 SQLite 事务中完成，进程崩溃不会留下写了一半的状态
+class StateStore:
+    def __init__(self, path):
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS state (
+                owner TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (owner, key)
+            );
+            CREATE TABLE IF NOT EXISTS reminders (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                run_time REAL NOT NULL,
+                msg_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending'
+            );
+            CREATE INDEX IF NOT EXISTS reminders_pending ON reminders (owner, status, run_time);
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner TEXT NOT NULL,
+                time REAL NOT NULL,
+                msg_type TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                ok INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS questions (
+                owner TEXT NOT NULL,
+                href TEXT NOT NULL,
+                upload_time REAL NOT NULL,
+                digest TEXT,
+                status TEXT NOT NULL,
+                claimed_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner, href)
+            );
+            CREATE INDEX IF NOT EXISTS questions_digest ON questions (owner, digest);
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        ''')
+        # 早先创建的状态库中 questions 表没有 attempts 列
+        if 'attempts' not in {row[1] for row in self.conn.execute('PRAGMA table_info(questions)')}:
+            self.conn.execute('ALTER TABLE questions ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def get(self, owner, key, default=None):
+        rows = self._execute('SELECT value FROM state WHERE owner = ? AND key = ?', (owner, key))
+        return json.loads(rows[0][0]) if len(rows) > 0 else default
+
+    def update(self, owner, values):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('BEGIN')
+                self.conn.executemany('INSERT OR REPLACE INTO state (owner, key, value) VALUES (?, ?, ?)',
+                                      [(owner, key, json.dumps(value)) for key, value in values.items()])
+
+    def add_reminder(self, reminder_id, owner, run_time, msg_type, content):
+        self._execute('INSERT OR REPLACE INTO reminders (id, owner, run_time, msg_type, content, status) '
+                      'SELECT ?, ?, ?, ?, ?, COALESCE((SELECT NULLIF(status, \'cancelled\') FROM reminders WHERE id = ?), '
+                      '\'pending\')',
+                      (reminder_id, owner, run_time.timestamp(), msg_type, json.dumps(content, ensure_ascii=False),
+                       reminder_id))
+
+    def pending_reminders(self, owner):
+        rows = self._execute('SELECT id, run_time, msg_type, content FROM reminders '
+                             'WHERE owner = ? AND status = \'pending\' ORDER BY run_time', (owner,))
+        return [(reminder_id, run_time, msg_type, json.loads(content)) for reminder_id, run_time, msg_type, content in
+                rows]
+
+    def reminder_status(self, reminder_id):
+        rows = self._execute('SELECT status FROM reminders WHERE id = ?', (reminder_id,))
+        return rows[0][0] if len(rows) > 0 else None
+
+    # 只有仍为 pending 的提醒能被认领，多个副本同时触发时只有一个会发送
+    def claim_reminder(self, reminder_id):
+        with self.lock:
+            cursor = self.conn.execute('UPDATE reminders SET status = \'sending\' WHERE id = ? AND status = \'pending\'',
+                                       (reminder_id,))
+            return cursor.rowcount == 1
+
+    def set_reminder_status(self, reminder_id, status):
+        self._execute('UPDATE reminders SET status = ? WHERE id = ?', (status, reminder_id))
+
+    # 已推送、内容重复而跳过或多次失败后放弃的问题链接，检查时不再处理
+    def delivered_questions(self, owner):
+        rows = self._execute('SELECT href FROM questions '
+                             'WHERE owner = ? AND status IN (\'delivered\', \'duplicate\', \'abandoned\')', (owner,))
+        return {href for href, in rows}
+
+    # 推送前先认领问题，同时运行的多次检查只有一次能认领成功
+    # 推送失败的问题可以立即重新认领，认领后超过 stale_before 仍未完成的视为进程已崩溃，也可以重新认领
+    # 认领时一并记录内容摘要，已推送或正在推送的其他问题内容相同时记为 duplicate
+    # 返回 'claimed' 或 'duplicate'，已被其他检查认领时返回 None
+    def claim_question(self, owner, href, upload_time, digest, stale_before):
+        with self.lock:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                cursor = self.conn.execute(
+                    'INSERT INTO questions (owner, href, upload_time, digest, status, claimed_at, attempts) '
+                    'VALUES (?, ?, ?, ?, \'claimed\', ?, 1) '
+                    'ON CONFLICT (owner, href) DO UPDATE SET digest = excluded.digest, status = \'claimed\', '
+                    'claimed_at = excluded.claimed_at, attempts = attempts + 1 '
+                    'WHERE status = \'failed\' OR (status = \'claimed\' AND claimed_at < ?)',
+                    (owner, href, upload_time.timestamp(), digest, time.time(), stale_before))
+                if cursor.rowcount != 1:
+                    return None
+                if digest is None:
+                    return 'claimed'
+                rows = self.conn.execute('SELECT 1 FROM questions WHERE owner = ? AND digest = ? AND href != ? '
+                                         'AND status IN (\'delivered\', \'claimed\') LIMIT 1',
+                                         (owner, digest, href)).fetchall()
+                if len(rows) > 0:
+                    self.conn.execute('UPDATE questions SET status = \'duplicate\' WHERE owner = ? AND href = ?',
+                                      (owner, href))
+                    return 'duplicate'
+                return 'claimed'
+
+    def finish_question(self, owner, href, status):
+        self._execute('UPDATE questions SET status = ? WHERE owner = ? AND href = ?', (status, owner, href))
+
+    # 下载或推送失败的问题下次检查时重试，认领次数达到 max_attempts 后放弃，返回新的状态
+    def fail_question(self, owner, href, max_attempts):
+        with self.lock:
+            self.conn.execute('UPDATE questions '
+                              'SET status = CASE WHEN attempts >= ? THEN \'abandoned\' ELSE \'failed\' END '
+                              'WHERE owner = ? AND href = ?', (max_attempts, owner, href))
+            rows = self.conn.execute('SELECT status FROM questions WHERE owner = ? AND href = ?',
+                                     (owner, href)).fetchall()
+        return rows[0][0] if len(rows) > 0 else None
+
+    # 最早一个尚未推送成功的问题的提交时间，检查时从这里开始扫描以便重试
+    def oldest_unfinished_question(self, owner):
+        rows = self._execute('SELECT MIN(upload_time) FROM questions '
+                             'WHERE owner = ? AND status IN (\'claimed\', \'failed\')', (owner,))
+        return rows[0][0]
+
+    # 租约未过期时只有持有者能续约，过期后任何副本都可以取得
+    def acquire_lease(self, name, holder, ttl):
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                'INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at '
+                'WHERE holder = excluded.holder OR expires_at < ?',
+                (name, holder, now + ttl, now))
+            return cursor.rowcount == 1
+
+    def release_lease(self, name, holder):
+        self._execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+
+    def record(self, owner, msg_type, content, ok):
+        digest = hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        self._execute('INSERT INTO history (owner, time, msg_type, digest, ok) VALUES (?, ?, ?, ?, ?)',
+                      (owner, time.time(), msg_type, digest, int(ok)))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_state(path):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+        return _stores[path]
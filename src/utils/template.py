@@ -0,0 +1,142 @@
+import json
+import string
+import threading
+
+# 每个模板可用的字段，加载配置时检查，渲染时不再检查
+FIELDS = {
+    'inform_header': {'count'},
+    'inform_class': {'index', 'name', 'shifted', 'teacher', 'place', 'start', 'end', 'students'},
+    'inform_footer': set(),
+    'reminder': {'name', 'shifted', 'teacher', 'place', 'start', 'end', 'students'},
+    'shifted_mark': set(),
+    'student_separator': set(),
+    'question_title': {'time'},
+    'raise_question_title': set(),
+    'raise_question': set(),
+    'raise_feedback_title': set(),
+    'raise_feedback': set(),
+}
+
+TEMPLATES = {
+    'zh': {
+        'inform_header': '早安[比心], 今天一共有{count}门课:\n\n',
+        'inform_class': '{index}. {name}{shifted}[{teacher}][{place}, {start} - {end}]\n学生: {students}\n',
+        'inform_footer': '\n大家要准时上课哦[天使]',
+        'reminder': '课程: {name}[{teacher}][{place}, {start}-{end}]即将开始，老师同学们不要忘啦[微笑]',
+        'shifted_mark': '（调课）',
+        'student_separator': '、',
+        'question_title': '[朋辈辅学] {time}',
+        'raise_question_title': '[朋辈辅学问题收集】',
+        'raise_question': '又到周末啦，相信大家都过了充实的一周呢~\n'
+                          '小朋友们有没有遇到新的问题呀，欢迎大家随时提问~\n'
+                          '[提问链接]https://jinshuju.net/f/xW193K\n'
+                          '祝大家周末愉快！[撒花]',
+        'raise_feedback_title': '[朋辈辅学反馈收集】',
+        'raise_feedback': '本周的课程都结束啦~\n'
+                          '欢迎大家填写问卷反馈[送花花]\n'
+                          '[反馈连接]https://jinshuju.net/f/C8nzMm',
+    },
+    'en': {
+        'inform_header': 'Good morning! There are {count} classes today:\n\n',
+        'inform_class': '{index}. {name}{shifted}[{teacher}][{place}, {start} - {end}]\nStudents: {students}\n',
+        'inform_footer': '\nPlease be on time!',
+        'reminder': 'Class: {name}[{teacher}][{place}, {start}-{end}] starts soon, see you there!',
+        'shifted_mark': ' (rescheduled)',
+        'student_separator': ', ',
+        'question_title': '[Peer Tutoring] {time}',
+        'raise_question_title': '[Peer Tutoring Questions]',
+        'raise_question': 'It is the weekend again, hope you all had a fruitful week~\n'
+                          'Did you run into any new problems? Questions are welcome at any time~\n'
+                          '[Ask here]https://jinshuju.net/f/xW193K\n'
+                          'Have a nice weekend!',
+        'raise_feedback_title': '[Peer Tutoring Feedback]',
+        'raise_feedback': 'All classes of this week are over~\n'
+                          'Please tell us what you think in the questionnaire\n'
+                          '[Feedback]https://jinshuju.net/f/C8nzMm',
+    },
+}
+
+MAX_FRAGMENTS = 4096
+
+_formatter = string.Formatter()
+
+
+# 模板预先拆成 (文字, 字段名) 序列，渲染只需按顺序拼接
+class Template:
+    __slots__ = ('source', 'parts')
+
+    def __init__(self, source, fields):
+        parts = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if field is not None:
+                if field not in fields:
+                    raise ValueError(f'unknown field {{{field}}}')
+                if spec or conversion:
+                    raise ValueError(f'format spec is not supported: {{{field}}}')
+            parts.append((literal, field))
+        self.source = source
+        self.parts = tuple(parts)
+
+    def render(self, values):
+        return ''.join([literal if field is None else literal + values[field] for literal, field in self.parts])
+
+
+# 某种语言的全部模板，配置中的 templates 覆盖同名的默认模板
+# 课程的时间、学生名单等字段和渲染结果按课程缓存，同一门课每周重复使用
+class TemplateSet:
+    def __init__(self, language='zh', overrides=None):
+        sources = dict(TEMPLATES[language])
+        sources.update(overrides or {})
+        self.templates = {}
+        for name, source in sources.items():
+            if name not in FIELDS:
+                raise ValueError(f'unknown template {name}')
+            try:
+                self.templates[name] = Template(source, FIELDS[name])
+            except ValueError as e:
+                raise ValueError(f'template {name}: {e}')
+        self.shifted_mark = self.templates['shifted_mark'].render({})
+        self.student_separator = self.templates['student_separator'].render({})
+        self.fragments = {}
+        self.lock = threading.Lock()
+
+    def render(self, name, **values):
+        return self.templates[name].render(values)
+
+    def _class_fields(self, i):
+        return {
+            'name': i.name,
+            'shifted': self.shifted_mark if i.shifted else '',
+            'teacher': i.teacher,
+            'place': i.place,
+            'start': i.start.strftime('%H:%M'),
+            'end': i.end.strftime('%H:%M'),
+            'students': self.student_separator.join(i.students),
+        }
+
+    # 渲染和某一门课有关的模板，不依赖日期，index 等额外字段也作为缓存键的一部分
+    def render_class(self, name, i, **values):
+        key = (name, i.name, i.teacher, i.place, i.start, i.end, i.students, i.shifted, tuple(values.items()))
+        text = self.fragments.get(key)
+        if text is None:
+            fields = self._class_fields(i)
+            fields.update(values)
+            text = self.templates[name].render(fields)
+            with self.lock:
+                if len(self.fragments) >= MAX_FRAGMENTS:
+                    self.fragments.clear()
+                self.fragments[key] = text
+        return text
+
+
+_sets = {}
+_sets_lock = threading.Lock()
+
+
+# 语言和覆盖模板相同的机器人共用一份预编译模板和片段缓存
+def get_templates(language='zh', overrides=None):
+    key = (language, json.dumps(overrides, sort_keys=True))
+    with _sets_lock:
+        if key not in _sets:
+            _sets[key] = TemplateSet(language, overrides)
+        return _sets[key]
@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import threading
+from datetime import time
+
+from src.utils.curriculum import Curriculum, Shift, ShiftInfo
+
+WEEKDAYS = ['周' + i for i in ['一', '二', '三', '四', '五', '六', '日']]
+TIME_PATTERN = re.compile(r'(\d{1,2})')
+COURSE_PATTERN = re.compile(r'(.+)（.{2,4}）')
+TEACHER_PATTERN = re.compile(r'（(.{2,4})）')
+
+
+def parse_curricula(path):
+    curricula = []
+    with open(path, 'r', encoding='UTF-8') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            line = line.split(',')
+            is_single = line[0] == '单'
+            weekday = WEEKDAYS.index(line[1])
+            start_h, start_m, end_h, end_m = [int(i) for i in TIME_PATTERN.findall(line[2])]
+            if '上午' not in line[2]:
+                start_h += 12
+                end_h += 12
+            place = line[3]
+            course = COURSE_PATTERN.findall(line[4])[0]
+            teacher = TEACHER_PATTERN.findall(line[4])[0]
+            students = line[5].split('、')
+            start = time(start_h, start_m, 0, 0)
+            end = time(end_h, end_m, 0, 0)
+            curricula.append(Curriculum(is_single, weekday, start, end, place, course, teacher, students))
+    return curricula
+
+
+def parse_shifts(path):
+    shifts = []
+    with open(path, 'r', encoding='UTF-8') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            line = line.split(',')
+            source, target = ShiftInfo(*line[0:5]), ShiftInfo(line[0], *line[5:9])
+            shifts.append(Shift(source, target))
+    return shifts
+
+
+def parse_corpus(path):
+    with open(path, 'r', encoding='UTF-8') as f:
+        return list(filter(lambda x: x != '', [line.strip() for line in f.readlines()]))
+
+
+# 只在文件修改时间变化时重新解析的文件缓存
+class CachedFile:
+    def __init__(self, path, loader, required=False):
+        self.path = path
+        self.loader = loader
+        self.required = required
+        self.mtime = None
+        self.value = None
+        self.version = 0
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self.required:
+                raise
+            mtime = -1
+        if mtime != self.mtime:
+            self.value = self.loader(self.path) if mtime != -1 else []
+            self.mtime = mtime
+            self.version += 1
+        return self.value
+
+
+_files = {}
+_stores = {}
+_lock = threading.RLock()
+
+
+# 同一个文件在进程内只解析、缓存一份
+def get_cached_file(path, loader, required=False):
+    with _lock:
+        key = (os.path.abspath(path), loader)
+        if key not in _files:
+            _files[key] = CachedFile(path, loader, required)
+        return _files[key]
+
+
+class TimetableStore:
+    def __init__(self, curricula_path, shifts_path, corpus_path):
+        self.curricula_file = get_cached_file(curricula_path, parse_curricula)
+        self.shifts_file = get_cached_file(shifts_path, parse_shifts)
+        self.corpus_file = get_cached_file(corpus_path, parse_corpus, required=True)
+        self.indexed_version = None
+        self.by_slot = {}
+        self.by_course = {}
+        self.shifts_from = {}
+        self.shifts_to = {}
+
+    @property
+    def curricula(self):
+        return self.curricula_file.get()
+
+    @property
+    def shifts(self):
+        return self.shifts_file.get()
+
+    @property
+    def corpus(self):
+        return self.corpus_file.get()
+
+    @property
+    def version(self):
+        self.curricula_file.get()
+        self.shifts_file.get()
+        return self.curricula_file.version, self.shifts_file.version
+
+    # 课表和调课文件分别建立索引，只有变化的文件重新建立
+    def _index(self):
+        curricula_version, shifts_version = self.version
+        indexed_curricula, indexed_shifts = self.indexed_version or (None, None)
+        if curricula_version != indexed_curricula:
+            by_slot, by_course = {}, {}
+            for curriculum in self.curricula:
+                by_slot.setdefault((curriculum.weekday, curriculum.is_single), []).append(curriculum)
+                by_course.setdefault((curriculum.name, curriculum.weekday, curriculum.start, curriculum.place),
+                                     []).append(curriculum)
+            self.by_slot, self.by_course = by_slot, by_course
+        if shifts_version != indexed_shifts:
+            shifts_from, shifts_to = {}, {}
+            for shift in self.shifts:
+                shifts_from.setdefault(shift.source.date, []).append(shift)
+                shifts_to.setdefault(shift.target.date, []).append(shift)
+            self.shifts_from, self.shifts_to = shifts_from, shifts_to
+        self.indexed_version = curricula_version, shifts_version
+
+    # 每个日期涉及的调课（调出或调入），用于找出调课文件变化影响的日期
+    def shifts_by_date(self):
+        self._index()
+        dates = {}
+        for shifts in (self.shifts_from, self.shifts_to):
+            for cur_date, date_shifts in shifts.items():
+                dates.setdefault(cur_date, []).extend(
+                    (s.source.course, s.source.date, s.source.start, s.source.place,
+                     s.target.date, s.target.start, s.target.end, s.target.place) for s in date_shifts)
+        return dates
+
+    # 某一天的全部课程（已处理调课），按开始时间排序
+    def classes_on(self, cur_date, is_single):
+        self._index()
+        class_list = [curriculum.get_class(cur_date)
+                      for curriculum in self.by_slot.get((cur_date.weekday(), is_single), [])]
+
+        # 当日课程调换到其他时间
+        for shift in self.shifts_from.get(cur_date, []):
+            source, target = shift.source, shift.target
+            for k, i in enumerate(class_list):
+                if source.course == i.name and source.start == i.start and source.place == i.place:
+                    logging.info(
+                        f'{i.name} shifted from {i.date.strftime("%Y-%m-%d")} {i.start.strftime("%H:%M")} to {target.date.strftime("%Y-%m-%d")} {target.start.strftime("%H:%M")}')
+                    class_list[k] = i.moved(target.date, target.start, target.end, target.place)
+
+        # 其他课程调换到当日
+        for shift in self.shifts_to.get(cur_date, []):
+            source, target = shift.source, shift.target
+            for i in self.by_course.get((source.course, source.date.weekday(), source.start, source.place), []):
+                logging.info(
+                    f'{i.name}（{i.place}） shifted from {source.date.strftime("%Y-%m-%d")} {i.start.strftime("%H:%M")} to {target.date.strftime("%Y-%m-%d")} {target.start.strftime("%H:%M")}')
+                class_list.append(i.get_class(cur_date).moved(cur_date, target.start, target.end, target.place))
+
+        return sorted(set(filter(lambda x: x.date == cur_date, class_list)))
+
+
+def get_store(curricula_path, shifts_path, corpus_path):
+    with _lock:
+        key = (os.path.abspath(curricula_path), os.path.abspath(shifts_path), os.path.abspath(corpus_path))
+        if key not in _stores:
+            _stores[key] = TimetableStore(curricula_path, shifts_path, corpus_path)
+        return _stores[key]
@@ -1,37 +1,116 @@
 import re
+import json
+import zipfile
 
 import openpyxl
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--input', type=str)
 parser.add_argument('--output', type=str, default='timetable.csv')
-args = parser.parse_args()
+parser.add_argument('--jobs', type=int, default=1, help='number of processes used to convert sheets')
+parser.add_argument('--incremental', action='store_true', help='only convert sheets changed since the last run')
 
+TITLE_PATTERN = re.compile(r'（(.+)）')
+
+
+def convert_rows(title, rows):
+    rows = list(rows)
+    if len(rows) < 2:
+        return []
+    max_col = max(len(row) for row in rows)
+
+    def value(i, j):
+        if i >= len(rows) or j >= len(rows[i]):
+            return None
+        return rows[i][j]
+
+    # 合并单元格只有左上角有值，沿用左侧教室名
+    classroom = []
+    for j in range(1, max_col):
+        if value(0, j) is not None:
+            classroom.append(str(value(0, j)))
+        else:
+            classroom.append(classroom[-1] if len(classroom) > 0 else str(value(0, 0)))
 
-def main():
-    book = openpyxl.load_workbook(args.input)
     classes = []
-    for sheet in [book[name] for name in book.sheetnames]:
-        title = re.compile(r'（(.+)）').findall(sheet.title)[0]
-        max_row = sheet.max_row
-        max_col = sheet.max_column
-        classroom = [
-            str(sheet.cell(1, i).value) if sheet.cell(1, i).value is not None else str(sheet.cell(1, i - 1).value)
-            for i in range(2, max_col + 1)]
-        for i in range(3, max_row + 1, 2):
-            time = str(sheet.cell(i, 1).value)
-            for j in range(2, max_col + 1):
-                if sheet.cell(i, j).value is not None:
-                    course = str(sheet.cell(i, j).value)
-                    students = str(sheet.cell(i + 1, j).value)
-                    classes.append([
-                        title, str(sheet.cell(2, j).value), time, classroom[j - 2], course, students
-                    ])
+    for i in range(2, len(rows), 2):
+        time = str(value(i, 0))
+        for j in range(1, max_col):
+            if value(i, j) is not None:
+                course = str(value(i, j))
+                students = str(value(i + 1, j))
+                classes.append([
+                    title, str(value(1, j)), time, classroom[j - 1], course, students
+                ])
+    return classes
+
+
+def convert_sheet(book, name):
+    title = TITLE_PATTERN.findall(name)[0]
+    return convert_rows(title, book[name].iter_rows(values_only=True))
+
+
+def convert_sheet_file(path, name):
+    book = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return convert_sheet(book, name)
+    finally:
+        book.close()
+
+
+# 用 xlsx 压缩包中各 sheet 的 CRC 判断是否修改，共享字符串表变化时所有 sheet 都视为修改
+def sheet_digests(path, book):
+    with zipfile.ZipFile(path) as z:
+        names = set(z.namelist())
+        shared = z.getinfo('xl/sharedStrings.xml').CRC if 'xl/sharedStrings.xml' in names else 0
+        digests = {}
+        for name in book.sheetnames:
+            sheet_path = book[name]._worksheet_path.lstrip('/')
+            digests[name] = f'{z.getinfo(sheet_path).CRC:08x}-{shared:08x}' if sheet_path in names else None
+        return digests
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r', encoding='UTF-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    book = openpyxl.load_workbook(args.input, read_only=True)
+    cache_path = args.output + '.cache'
+    cache = load_cache(cache_path) if args.incremental else {}
+    digests = sheet_digests(args.input, book)
+
+    sheets = {}
+    todo = []
+    for name in book.sheetnames:
+        cached = cache.get(name)
+        if cached is not None and digests[name] is not None and cached['digest'] == digests[name]:
+            sheets[name] = cached['classes']
+        else:
+            todo.append(name)
+
+    if args.jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            sheets.update(zip(todo, executor.map(convert_sheet_file, [args.input] * len(todo), todo)))
+    else:
+        for name in todo:
+            sheets[name] = convert_sheet(book, name)
+    book.close()
 
     with open(args.output, 'w', encoding='UTF-8') as f:
-        for line in classes:
-            print(",".join(line), file=f)
+        for name in book.sheetnames:
+            for line in sheets[name]:
+                print(",".join(line), file=f)
+    with open(cache_path, 'w', encoding='UTF-8') as f:
+        json.dump({name: {'digest': digests[name], 'classes': sheets[name]} for name in book.sheetnames}, f,
+                  ensure_ascii=False)
     return
 
 
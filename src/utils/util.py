@@ -7,6 +7,15 @@ from datetime import datetime
 import urllib3
 from dateutil import tz
 
+from src.utils.cache import CHUNK_SIZE
+
+TZ = tz.gettz('Asia/Shanghai')
+
+# 进程内共享的连接池，避免每次请求重新握手
+http = urllib3.PoolManager(num_pools=8, maxsize=8)
+# 推送和获取问卷页面的超时，与 asyncio 引擎下会话的总超时一致，连接卡住时按失败处理
+REQUEST_TIMEOUT = urllib3.Timeout(connect=10, read=30)
+
 
 def get_sign(secret, timestamp):
     secret_enc = secret.encode('utf-8')
@@ -17,17 +26,58 @@ def get_sign(secret, timestamp):
     return sign
 
 
+# 与 get_sign 结果相同，密钥只编码一次，每次签名复制预先初始化好的 HMAC 状态
+class Signer:
+    def __init__(self, secret):
+        self.suffix = '\n{}'.format(secret).encode('utf-8')
+        self.mac = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+
+    def sign(self, timestamp):
+        mac = self.mac.copy()
+        mac.update(str(timestamp).encode('utf-8') + self.suffix)
+        # base64 结果中需要转义的只有 + / =
+        return base64.b64encode(mac.digest()).decode('ascii').replace('+', '%2B').replace('/', '%2F').replace('=', '%3D')
+
+
 def parse_time(time_str):
+    # 问卷中的时间都是 YYYY-MM-DD HH:MM:SS，fromisoformat 远快于 strptime，其余格式再交给 strptime
+    # fromisoformat 还接受只有日期或带时区的字符串，先确认长度和分隔符位置，保证与 strptime 结果一致
+    if isinstance(time_str, str) and len(time_str) == 19 and time_str[10] == ' ' \
+            and time_str[13] == ':' and time_str[16] == ':':
+        try:
+            return datetime.fromisoformat(time_str).replace(tzinfo=TZ)
+        except ValueError:
+            pass
     try:
-        return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").replace(
-            tzinfo=tz.gettz('Asia/Shanghai'))
-    except ValueError:
+        return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TZ)
+    except (ValueError, TypeError):
         return None
 
 
-def download(item):
-    http = urllib3.PoolManager()
-    r = http.request('GET', item['href'], preload_content=False)
-    data = r.data.decode(encoding='utf-8')
-    r.release_conn()
-    return data
+# 提供 cache 时先查缓存，未命中时边下载边写入缓存文件，不在内存中保留整个响应
+def download(item, timeout=None, cache=None):
+    url = item['href']
+    headers = {}
+    if cache is not None:
+        text = cache.get(url)
+        if text is not None:
+            return text
+        headers = cache.validators(url)
+    r = http.request('GET', url, headers=headers, preload_content=False, timeout=timeout)
+    try:
+        if r.status == 304 and cache is not None:
+            return cache.get(url, revalidated=True)
+        if r.status != 200:
+            raise urllib3.exceptions.HTTPError(f'status {r.status}')
+        if cache is None:
+            return r.data.decode(encoding='utf-8')
+        writer = cache.writer(url)
+        try:
+            for chunk in r.stream(CHUNK_SIZE):
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(r.headers.get('ETag'))
+    finally:
+        r.release_conn()
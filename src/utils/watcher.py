@@ -0,0 +1,146 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+# 监视课表、调课、语料和配置文件，文件变化后回调
+# Linux 上使用 inotify 监视文件所在目录（编辑器常以改名方式保存），其他平台按 mtime 轮询
+class FileWatcher:
+    def __init__(self, debounce=0.5, poll_interval=5):
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.callbacks = {}
+        self.mtimes = {}
+        self.dirs = {}
+        self.fd = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    # 同一个 key 重复注册时替换原回调，便于重新加载配置后重新注册
+    def watch(self, path, key, callback):
+        path = os.path.abspath(path)
+        with self.lock:
+            self.callbacks.setdefault(path, {})[key] = callback
+            self.mtimes.setdefault(path, self._mtime(path))
+            if self.fd is not None:
+                self._add_dir(os.path.dirname(path))
+
+    def unwatch(self, key):
+        with self.lock:
+            for callbacks in self.callbacks.values():
+                callbacks.pop(key, None)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return -1
+
+    def _add_dir(self, directory):
+        if directory in self.dirs.values():
+            return
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logging.warning(f'cannot watch {directory}: {os.strerror(ctypes.get_errno())}')
+            return
+        self.dirs[wd] = directory
+
+    def start(self):
+        if self.thread is not None:
+            return
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_CLOEXEC)
+            if fd >= 0:
+                self.fd = fd
+                with self.lock:
+                    for path in self.callbacks:
+                        self._add_dir(os.path.dirname(path))
+        target = self._run_inotify if self.fd is not None else self._run_polling
+        logging.info(f'watching {len(self.callbacks)} files ({"inotify" if self.fd is not None else "polling"})')
+        self.thread = threading.Thread(target=target, name='watcher', daemon=True)
+        self.thread.start()
+
+    def _read_events(self):
+        data = os.read(self.fd, 4096)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd in self.dirs and name:
+                paths.add(os.path.join(self.dirs[wd], os.fsdecode(name)))
+        return paths
+
+    def _run_inotify(self):
+        while True:
+            paths = self._read_events()
+            # 合并短时间内的连续写入，只回调一次
+            deadline = time.monotonic() + self.debounce
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or not select.select([self.fd], [], [], timeout)[0]:
+                    break
+                paths |= self._read_events()
+            self._changed(paths)
+
+    def _run_polling(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self._changed(list(self.callbacks))
+
+    # 只有 mtime 确实变化的文件才回调
+    def _changed(self, paths):
+        with self.lock:
+            changed = []
+            for path in paths:
+                if path not in self.callbacks:
+                    continue
+                mtime = self._mtime(path)
+                if mtime != self.mtimes.get(path):
+                    self.mtimes[path] = mtime
+                    changed.append((path, list(self.callbacks[path].values())))
+        for path, callbacks in changed:
+            logging.info(f'{path} changed')
+            for callback in callbacks:
+                try:
+                    callback(path)
+                except Exception:
+                    logging.exception(f'handle change of {path} failed')
+
+
+_libc = _load_inotify()
+_watcher = None
+
+
+def get_watcher():
+    global _watcher
+    if _watcher is None:
+        _watcher = FileWatcher()
+    return _watcher